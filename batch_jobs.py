@@ -0,0 +1,813 @@
+import os
+import copy
+import time
+import json
+import uuid
+import random
+import logging
+import threading
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from system_prompt import get_system_prompt_version
+from structured_output import parse_sts_output, OutputParseError
+from metrics import ParseStats, append_metric
+from cost_planner import log_plan
+from sts_generator import (
+    PROMPTS_FILE, load_prompts, select_prompt, build_request_body, extract_output_text, extract_usage,
+)
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+# Terminal statuses whose output file holds the results of the requests that did run
+DOWNLOADABLE_STATUSES = ("completed", "expired", "cancelled")
+
+logger = logging.getLogger(__name__)
+
+
+class BatchJobManager:
+    """Creates, tracks, downloads and repairs OpenAI Batch API jobs for STS generation.
+
+    ``client`` is a synchronous ``OpenAI`` client and ``registry`` a ``JobRegistry``.
+    With a ``planner`` (``CostPlanner``) every new batch is estimated, trimmed to the
+    planner's budget and registered with its estimate before upload.
+    """
+
+    kind = 'batch'
+    metadata_source = 'batch'
+    # Watch downloads run in threads and may finish the last batch of a fan-out at the same time
+    _align_lock = threading.Lock()
+
+    def __init__(self, client, registry, output_folder, model, prompt_type='both',
+                 prompts_file=PROMPTS_FILE, structured_output=False, planner=None):
+        self.client = client
+        self.registry = registry
+        self.output_folder = output_folder
+        self.model = model
+        self.prompt_type = prompt_type
+        self.prompts = load_prompts(prompts_file, prompt_type)
+        self.structured_output = structured_output
+        self.planner = planner
+
+    def for_model(self, model):
+        """Copy of this manager targeting another model (shares client, registry and prompts)."""
+        manager = copy.copy(self)
+        manager.model = model
+        return manager
+
+    def _root_dir(self):
+        return os.path.join(self.output_folder, 'output')
+
+    def _fanout_dir(self, fanout_id):
+        return os.path.join(self.output_folder, 'output', 'fanout', fanout_id)
+
+    def _batch_dir(self, batch_id):
+        return os.path.join(self._root_dir(), batch_id)
+
+    def _results_paths(self, batch_id):
+        """Return the (jsonl, excel) paths of a batch dataset."""
+        batch_dir = self._batch_dir(batch_id)
+        return os.path.join(batch_dir, 'sts_database.jsonl'), os.path.join(batch_dir, 'sts_database.xlsx')
+
+    def results_file(self, batch_id):
+        """Path of the downloaded JSONL dataset of a batch."""
+        return self._results_paths(batch_id)[0]
+
+    def create_batch_request(self, custom_id, row, text_input, model=None, structured_output=None):
+        """Create a single batch request entry."""
+        if structured_output is None:
+            structured_output = self.structured_output
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/responses",
+            "body": build_request_body(model or self.model, row, text_input, structured_output)
+        }
+
+    def build_requests(self, sentences):
+        """Assign a prompt to every sentence; returns (requests, metadata keyed by custom_id)."""
+        metadata = {}
+        requests = []
+        for idx, input_sentence in enumerate(sentences, 1):
+            row = select_prompt(self.prompts, idx, self.prompt_type)
+            custom_id = f"request-{idx}"
+            requests.append(self.create_batch_request(custom_id, row, input_sentence))
+
+            # Store metadata to merge with results later
+            metadata[custom_id] = {
+                "input_sentence": input_sentence,
+                "prompt_type": row['Prompt type'],
+                "prompt_instruction": row['Prompt']
+            }
+        return requests, metadata
+
+    def submit_requests(self, requests, metadata):
+        """Upload a list of batch requests, start the batch and save requests + metadata in its folder."""
+        # Write requests to a temporary file for upload
+        os.makedirs(self._root_dir(), exist_ok=True)
+        temp_batch_file = os.path.join(self._root_dir(), f"batch_requests_temp_{uuid.uuid4().hex[:8]}.jsonl")
+        with open(temp_batch_file, 'w') as f:
+            for request in requests:
+                f.write(json.dumps(request) + '\n')
+
+        logger.info(f"Created batch file | FILE={temp_batch_file}")
+
+        # Upload file to OpenAI
+        with open(temp_batch_file, 'rb') as f:
+            uploaded_file = self.client.files.create(file=f, purpose="batch")
+
+        logger.info(f"Uploaded file | FILE_ID={uploaded_file.id}")
+
+        # Create batch job
+        batch = self.client.batches.create(
+            input_file_id=uploaded_file.id,
+            endpoint="/v1/responses",
+            completion_window="24h"
+        )
+
+        # Create batch-specific folder and save metadata + requests there
+        batch_dir = self._batch_dir(batch.id)
+        os.makedirs(batch_dir, exist_ok=True)
+        os.rename(temp_batch_file, os.path.join(batch_dir, "batch_requests.jsonl"))
+        with open(os.path.join(batch_dir, "batch_metadata.json"), 'w') as f:
+            json.dump(metadata, f)
+
+        return batch, uploaded_file, batch_dir
+
+    def requests_from_metadata(self, metadata, custom_ids=None, model=None, structured_output=None):
+        """Rebuild batch requests from stored metadata (input sentence and prompt per custom_id)."""
+        requests = []
+        for custom_id in (metadata if custom_ids is None else custom_ids):
+            meta = metadata[custom_id]
+            row = {'Prompt': meta['prompt_instruction'], 'Prompt type': meta['prompt_type']}
+            requests.append(self.create_batch_request(
+                custom_id, row, meta['input_sentence'], model=model, structured_output=structured_output
+            ))
+        return requests
+
+    def plan_requests(self, metadata, models=None):
+        """Estimate the requests in ``metadata`` for each model and trim them to the planner's budget."""
+        requests_by_model = {
+            model: self.requests_from_metadata(metadata, model=model) for model in (models or [self.model])
+        }
+        plan = self.planner.plan(requests_by_model, metadata)
+        log_plan(plan)
+        return plan
+
+    def plan_batch(self, sentences, models=None):
+        """Build and estimate the requests of a batch (or fan-out) without uploading anything."""
+        _, metadata = self.build_requests(sentences)
+        return self.plan_requests(metadata, models)
+
+    def _apply_plan(self, metadata, models):
+        """Return (kept metadata, {model: estimate}, sentence count); unchanged without a planner."""
+        sentences = {meta['input_sentence'] for meta in metadata.values()}
+        if self.planner is None:
+            return metadata, {}, len(sentences)
+        plan = self.plan_requests(metadata, models)
+        if plan["dropped"]:
+            logger.warning(f"Requests trimmed to budget | DROPPED={plan['dropped']} | KEPT={len(plan['kept'])} | MAX_BUDGET={plan['max_budget']}")
+        metadata = {custom_id: metadata[custom_id] for custom_id in plan["kept"]}
+        return metadata, plan["models"], len({meta['input_sentence'] for meta in metadata.values()})
+
+    def create_batch(self, sentences, filename_filter=None, route_run_id=None):
+        """Build requests for the given sentences, submit them and register the job."""
+        requests, metadata = self.build_requests(sentences)
+        num_sentences = len(sentences)
+        estimate = None
+        if self.planner is not None:
+            metadata, estimates, num_sentences = self._apply_plan(metadata, [self.model])
+            requests = [request for request in requests if request["custom_id"] in metadata]
+            estimate = estimates[self.model]
+        if not requests:
+            logger.error("No requests fit the budget, nothing submitted")
+            return None
+        return self._submit_job(requests, metadata, num_sentences, filename_filter, route_run_id=route_run_id,
+                                estimate=estimate)
+
+    def _submit_job(self, requests, metadata, num_sentences, filename_filter=None, route_run_id=None,
+                    fanout_id=None, estimate=None):
+        logger.info(
+            "Creating batch | MODEL=%s | PROMPT_TYPE=%s | SENTENCES=%s | REQUESTS=%s",
+            self.model,
+            self.prompt_type,
+            num_sentences,
+            len(requests),
+        )
+
+        batch, uploaded_file, batch_dir = self.submit_requests(requests, metadata)
+
+        prompt_version = get_system_prompt_version()
+        logger.info(
+            "Batch created | BATCH_ID=%s | STATUS=%s | SYSTEM_PROMPT=%s | MODEL=%s | PROMPT_TYPE=%s",
+            batch.id,
+            batch.status,
+            prompt_version,
+            self.model,
+            self.prompt_type,
+        )
+        logger.info(f"Batch files saved | DIR={batch_dir}")
+        logger.info(f"Run with --mode status --batch-id {batch.id} to check progress")
+
+        self.registry.add_job(
+            batch.id,
+            model=self.model,
+            status=batch.status,
+            kind=self.kind,
+            prompt_type=self.prompt_type,
+            filename_filter=filename_filter,
+            num_sentences=num_sentences,
+            system_prompt_version=prompt_version,
+            input_file_id=uploaded_file.id,
+            structured_output=self.structured_output,
+            route_run_id=route_run_id,
+            fanout_id=fanout_id,
+            estimated_input_tokens=estimate["input_tokens"] if estimate else None,
+            estimated_output_tokens=estimate["output_tokens"] if estimate else None,
+            estimate_calibration=estimate["calibration"] if estimate else None,
+            estimated_cost=estimate["cost"] if estimate else None,
+            estimated_requests=estimate["requests"] if estimate else None,
+        )
+        logger.info(f"Batch registered | REGISTRY={self.registry.path}")
+
+        return batch.id
+
+    def create_fanout(self, sentences, models, filename_filter=None):
+        """Submit one batch per model over the same sentences and prompt assignment.
+
+        Prompts are assigned once, so every model answers identical requests under
+        identical custom_ids. The per-model shards are built and uploaded concurrently.
+        Returns (fanout_id, {model: batch_id}).
+        """
+        _, metadata = self.build_requests(sentences)
+        metadata, estimates, num_sentences = self._apply_plan(metadata, models)
+        if not metadata:
+            logger.error("No requests fit the budget, nothing submitted")
+            return None, {}
+        # Unique across processes: several fan-outs can start in the same second
+        fanout_id = f"{datetime.now().strftime('fanout_%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        fanout_dir = self._fanout_dir(fanout_id)
+        os.makedirs(fanout_dir, exist_ok=True)
+        with open(os.path.join(fanout_dir, 'fanout_metadata.json'), 'w') as f:
+            json.dump(metadata, f)
+
+        logger.info(f"Creating fan-out | FANOUT_ID={fanout_id} | MODELS={','.join(models)} | REQUESTS_PER_MODEL={len(metadata)}")
+
+        def submit(model):
+            manager = self.for_model(model)
+            requests = manager.requests_from_metadata(metadata)
+            return manager._submit_job(requests, metadata, num_sentences, filename_filter, fanout_id=fanout_id,
+                                       estimate=estimates.get(model))
+
+        with ThreadPoolExecutor(max_workers=len(models)) as pool:
+            batch_ids = dict(zip(models, pool.map(submit, models)))
+
+        with open(os.path.join(fanout_dir, 'fanout.json'), 'w') as f:
+            json.dump({
+                "fanout_id": fanout_id,
+                "kind": self.kind,
+                "prompt_type": self.prompt_type,
+                "num_sentences": num_sentences,
+                "batches": batch_ids,
+            }, f, indent=2)
+        logger.info(f"Fan-out created | FANOUT_ID={fanout_id} | DIR={fanout_dir}")
+        logger.info("Aligned output is written once the batch of every model is downloaded")
+        return fanout_id, batch_ids
+
+    def align_fanout(self, fanout_id):
+        """Join the downloaded per-model results of a fan-out by custom_id.
+
+        Writes ``aligned.jsonl`` (one record per request with an ``outputs`` dict keyed
+        by model) and ``aligned.xlsx`` (one output column per model). Models that are
+        not downloaded yet are left out. Returns the JSONL path or None.
+        """
+        with self._align_lock:
+            return self._align_fanout(fanout_id)
+
+    def _align_fanout(self, fanout_id):
+        jobs = self.registry.fanout_jobs(fanout_id)
+        if not jobs:
+            logger.error(f"Unknown fan-out | FANOUT_ID={fanout_id}")
+            return None
+        fanout_dir = self._fanout_dir(fanout_id)
+        with open(os.path.join(fanout_dir, 'fanout_metadata.json'), 'r') as f:
+            metadata = json.load(f)
+
+        outputs = {}
+        for job in jobs:
+            if not job['downloaded_at']:
+                continue
+            output_file, _ = self._results_paths(job['batch_id'])
+            # Every model answers the same custom_ids, so duplicate sentence/prompt pairs stay apart
+            by_id = {}
+            with open(output_file, 'r') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    by_id[entry.get('custom_id')] = entry.get('output_sentence')
+            outputs[job['model']] = by_id
+
+        aligned = []
+        for custom_id, meta in metadata.items():
+            aligned.append({
+                "custom_id": custom_id,
+                **meta,
+                "outputs": {model: by_id.get(custom_id) for model, by_id in outputs.items()},
+            })
+
+        aligned_file = os.path.join(fanout_dir, 'aligned.jsonl')
+        with open(aligned_file, 'w') as f:
+            for entry in aligned:
+                f.write(json.dumps(entry) + '\n')
+        aligned_df = pd.DataFrame([
+            {**{k: v for k, v in entry.items() if k != 'outputs'}, **entry['outputs']} for entry in aligned
+        ])
+        aligned_df.to_excel(os.path.join(fanout_dir, 'aligned.xlsx'), index=False)
+
+        logger.info(
+            "Fan-out aligned | FANOUT_ID=%s | MODELS=%s | PENDING=%s | REQUESTS=%s | FILE=%s",
+            fanout_id,
+            ','.join(outputs),
+            len(jobs) - len(outputs),
+            len(aligned),
+            aligned_file,
+        )
+        return aligned_file
+
+    def retrieve(self, batch_id):
+        """Fetch a batch from the API and record its status in the registry."""
+        batch = self.client.batches.retrieve(batch_id)
+        self.registry.record_status(batch_id, batch.status, batch.output_file_id, batch.error_file_id)
+        return batch
+
+    def check_status(self, batch_id):
+        """Check the status of a batch job."""
+        batch = self.retrieve(batch_id)
+
+        logger.info(f"Batch status | ID={batch_id}")
+        logger.info(f"  STATUS={batch.status}")
+        logger.info(f"  TOTAL={batch.request_counts.total}")
+        logger.info(f"  COMPLETED={batch.request_counts.completed}")
+        logger.info(f"  FAILED={batch.request_counts.failed}")
+
+        if batch.status == "completed":
+            logger.info(f"Run with --mode download --batch-id {batch_id} to get results")
+        elif batch.status in DOWNLOADABLE_STATUSES:
+            logger.info(f"Run with --mode download --batch-id {batch_id} to get the partial results, then --mode repair")
+
+        return batch.status
+
+    def download_results(self, batch_id):
+        """Download and process batch results; returns the dataset path or None.
+
+        Expired and cancelled batches are downloaded too: the requests that ran before
+        the batch stopped are kept and the rest are recorded as failures for repair.
+        """
+        batch = self.retrieve(batch_id)
+
+        if batch.status not in DOWNLOADABLE_STATUSES:
+            logger.error(f"Batch not complete | STATUS={batch.status}")
+            return None
+        if batch.status != "completed":
+            logger.warning(f"Batch {batch.status}, downloading partial results | ID={batch_id}")
+
+        # Load metadata from batch-specific folder
+        batch_dir = self._batch_dir(batch_id)
+        with open(os.path.join(batch_dir, "batch_metadata.json"), 'r') as f:
+            metadata = json.load(f)
+
+        # Download results (a batch where every request failed has no output file)
+        result_content = self.client.files.content(batch.output_file_id).text if batch.output_file_id else ""
+        error_content = self.client.files.content(batch.error_file_id).text if batch.error_file_id else ""
+
+        # Process results
+        results_database = []
+        succeeded = set()
+        failures = {}
+        parse_stats = ParseStats()
+        total_input_tokens = 0
+        total_output_tokens = 0
+        # Requests that returned usage; the token totals cover only these
+        usage_requests = 0
+        # prompt_type -> [requests, output tokens], feeds the cost planner's output estimates
+        output_by_type = {}
+
+        for line in result_content.strip().split('\n'):
+            if not line:
+                continue
+            result = json.loads(line)
+            custom_id = result['custom_id']
+
+            if result['response']['status_code'] == 200:
+                response_body = result['response']['body']
+                content = extract_output_text(response_body)
+
+                # Track tokens (failed parses burned tokens too)
+                usage = response_body.get('usage', {})
+                input_tokens, output_tokens = extract_usage(usage)
+                total_input_tokens += input_tokens
+                total_output_tokens += output_tokens
+                usage_requests += 1
+                type_totals = output_by_type.setdefault(metadata[custom_id]['prompt_type'], [0, 0])
+                type_totals[0] += 1
+                type_totals[1] += output_tokens
+
+                try:
+                    parsed_result = parse_sts_output(content)
+                except OutputParseError as e:
+                    logger.error(f"JSON parse error | ID={custom_id} | ERROR={e}")
+                    failures[custom_id] = f"json_parse_error: {e}"
+                    parse_stats.add(False, output_tokens)
+                    continue
+
+                # Add metadata; the custom_id identifies the request across models and repairs
+                parsed_result.update(metadata[custom_id])
+                parsed_result['custom_id'] = custom_id
+
+                results_database.append(parsed_result)
+                succeeded.add(custom_id)
+                parse_stats.add(True, output_tokens)
+            else:
+                logger.error(f"Request failed | ID={custom_id} | ERROR={result['response']}")
+                failures[custom_id] = f"status_code={result['response']['status_code']}"
+
+        for line in error_content.strip().split('\n'):
+            if not line:
+                continue
+            error = json.loads(line)
+            logger.error(f"Request errored | ID={error['custom_id']} | ERROR={error.get('error') or error.get('response')}")
+            failures[error['custom_id']] = "error_file"
+
+        # Requests that appear in neither file (e.g. a cancelled batch never got to them) are failures too
+        for custom_id in metadata:
+            if custom_id not in succeeded and custom_id not in failures:
+                failures[custom_id] = "missing"
+
+        # Save results
+        output_file = self._write_results(batch_id, results_database)
+
+        # Save failed custom_ids so they can be resubmitted with --mode repair
+        failures_file = os.path.join(batch_dir, 'batch_failures.json')
+        with open(failures_file, 'w') as f:
+            json.dump(failures, f, indent=2)
+        logger.info(f"Failures recorded | FAILED={len(failures)} | FILE={failures_file}")
+
+        job = self.registry.get_job(batch_id) or {}
+        # A re-download rebuilt the dataset and failures from the API output alone
+        if job.get('downloaded_at'):
+            self._reapply_repairs(batch_id)
+
+        stats = parse_stats.summary()
+        # A re-download must not count the same batch twice
+        if not job.get('downloaded_at'):
+            append_metric(self.output_folder, 'parse_stats', {
+                "source": self.metadata_source,
+                "batch_id": batch_id,
+                "model": job.get('model') or self.model,
+                "system_prompt_version": job.get('system_prompt_version') or get_system_prompt_version(),
+                "structured_output": bool(job.get('structured_output')),
+                **stats,
+            })
+        logger.info(
+            "Parse stats | REQUESTS=%s | PARSE_FAILURES=%s | FAILURE_RATE=%.3f | OUTPUT_TOKENS_PER_RECORD=%s",
+            stats["requests"],
+            stats["parse_failures"],
+            stats["parse_failure_rate"],
+            stats["output_tokens_per_record"],
+        )
+
+        # Follow-up batches from --mode repair are merged back into their parent's dataset (once)
+        if job.get('parent_batch_id') and not job.get('downloaded_at'):
+            self._merge_into_parent(job['parent_batch_id'], results_database, set(metadata))
+
+        # Batches submitted by main_route.py also land in the run's unified output (once)
+        if job.get('route_run_id') and not job.get('downloaded_at'):
+            self._append_to_routed_output(job['route_run_id'], batch_id, results_database)
+
+        logger.info(f"Token usage | INPUT={total_input_tokens} | OUTPUT={total_output_tokens} | TOTAL={total_input_tokens + total_output_tokens}")
+        self._record_token_usage(batch_id, job, output_by_type, total_input_tokens, total_output_tokens,
+                                 usage_requests)
+
+        self.registry.mark_downloaded(batch_id, total_input_tokens, total_output_tokens, usage_requests)
+        logger.info(f"Registry updated | ID={batch_id} | REGISTRY={self.registry.path}")
+
+        # Fan-outs are aligned across models once every per-model batch is downloaded
+        fanout_id = job.get('fanout_id')
+        if fanout_id and all(j['downloaded_at'] for j in self.registry.fanout_jobs(fanout_id)):
+            self.align_fanout(fanout_id)
+
+        return output_file
+
+    def _record_token_usage(self, batch_id, job, output_by_type, input_tokens, output_tokens, usage_requests):
+        """Append actual output tokens per prompt type, and estimated vs actual usage if the job was planned."""
+        # A re-download must not count the same batch twice
+        if job.get('downloaded_at'):
+            return
+        model = job.get('model') or self.model
+        for prompt_type, (requests, type_output_tokens) in output_by_type.items():
+            append_metric(self.output_folder, 'output_tokens', {
+                "batch_id": batch_id,
+                "model": model,
+                "prompt_type": prompt_type,
+                "structured_output": bool(job.get('structured_output')),
+                "requests": requests,
+                "output_tokens": type_output_tokens,
+            })
+
+        if job.get('estimated_input_tokens') is None:
+            return
+        append_metric(self.output_folder, 'token_estimates', {
+            "batch_id": batch_id,
+            "model": model,
+            "estimated_input_tokens": job['estimated_input_tokens'],
+            "actual_input_tokens": input_tokens,
+            "estimated_output_tokens": job['estimated_output_tokens'],
+            "actual_output_tokens": output_tokens,
+            "estimate_calibration": job['estimate_calibration'],
+            "estimated_cost": job['estimated_cost'],
+            "estimated_requests": job['estimated_requests'],
+            "usage_requests": usage_requests,
+        })
+        logger.info(
+            "Estimate vs actual | INPUT=%s/%s | OUTPUT=%s/%s | REQUESTS=%s/%s",
+            job['estimated_input_tokens'],
+            input_tokens,
+            job['estimated_output_tokens'],
+            output_tokens,
+            job['estimated_requests'],
+            usage_requests,
+        )
+
+    def _write_results(self, batch_id, results_database):
+        """Write a batch dataset as JSONL and Excel."""
+        output_file, excel_file = self._results_paths(batch_id)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with open(output_file, 'w') as f:
+            for entry in results_database:
+                f.write(json.dumps(entry) + '\n')
+
+        # Save results as Excel
+        results_df = pd.DataFrame(results_database)
+        results_df.to_excel(excel_file, index=False)
+
+        logger.info(f"Results saved | TOTAL_ENTRIES={len(results_database)} | JSONL={output_file} | EXCEL={excel_file}")
+        return output_file
+
+    def _merge_into_parent(self, parent_batch_id, repaired_results, resubmitted_ids):
+        """Append repaired results to the parent dataset and drop resubmitted IDs from its failures."""
+        parent_results = []
+        parent_output, _ = self._results_paths(parent_batch_id)
+        if os.path.exists(parent_output):
+            with open(parent_output, 'r') as f:
+                parent_results = [json.loads(line) for line in f if line.strip()]
+        self._write_results(parent_batch_id, parent_results + repaired_results)
+
+        # Anything still failing is tracked in the follow-up batch's own failure file
+        failures_file = os.path.join(self._batch_dir(parent_batch_id), 'batch_failures.json')
+        if os.path.exists(failures_file):
+            with open(failures_file, 'r') as f:
+                parent_failures = json.load(f)
+            parent_failures = {k: v for k, v in parent_failures.items() if k not in resubmitted_ids}
+            with open(failures_file, 'w') as f:
+                json.dump(parent_failures, f, indent=2)
+
+        logger.info(
+            "Merged into parent | PARENT_ID=%s | REPAIRED=%s | RESUBMITTED=%s",
+            parent_batch_id,
+            len(repaired_results),
+            len(resubmitted_ids),
+        )
+
+    def _reapply_repairs(self, batch_id):
+        """Merge the downloaded follow-up batches of a root batch into its re-downloaded dataset again."""
+        for child in self.registry.child_jobs(batch_id):
+            if not child['downloaded_at']:
+                continue
+            with open(os.path.join(self._batch_dir(child['batch_id']), 'batch_metadata.json'), 'r') as f:
+                resubmitted_ids = set(json.load(f))
+            child_output = self.results_file(child['batch_id'])
+            child_results = []
+            if os.path.exists(child_output):
+                with open(child_output, 'r') as f:
+                    child_results = [json.loads(line) for line in f if line.strip()]
+            self._merge_into_parent(batch_id, child_results, resubmitted_ids)
+
+    def _append_to_routed_output(self, run_id, batch_id, results_database):
+        """Append batch results to the unified output of a routed run."""
+        routed_file = os.path.join(self.output_folder, 'output', 'routed', run_id, 'sts_database.jsonl')
+        os.makedirs(os.path.dirname(routed_file), exist_ok=True)
+        lines = "".join(
+            json.dumps({**entry, "execution": "batch", "batch_id": batch_id}) + '\n'
+            for entry in results_database
+        )
+        with open(routed_file, 'a') as f:
+            f.write(lines)
+        logger.info(f"Appended to routed output | RUN_ID={run_id} | ENTRIES={len(results_database)} | FILE={routed_file}")
+
+    def repair_batch(self, batch_id):
+        """Resubmit the failed and unparsable requests of a downloaded batch as a follow-up batch.
+
+        The follow-up batch reuses the original custom_ids and is linked to the root
+        batch in the registry, so downloading it merges its results into the root dataset.
+        """
+        batch_dir = self._batch_dir(batch_id)
+        failures_file = os.path.join(batch_dir, 'batch_failures.json')
+        if not os.path.exists(failures_file):
+            logger.error(f"No failure file, download the batch first | FILE={failures_file}")
+            return None
+        with open(failures_file, 'r') as f:
+            failures = json.load(f)
+        if not failures:
+            logger.info(f"Nothing to repair | ID={batch_id}")
+            return None
+
+        with open(os.path.join(batch_dir, "batch_metadata.json"), 'r') as f:
+            metadata = json.load(f)
+
+        job = self.registry.get_job(batch_id) or {}
+        model = job.get('model') or self.model
+        structured_output = bool(job.get('structured_output')) if job else self.structured_output
+        root_batch_id = job.get('parent_batch_id') or batch_id
+
+        # A follow-up that is still open would be merged into the root as well, duplicating records
+        # (a failed batch has no output and is never merged)
+        open_children = [
+            child['batch_id'] for child in self.registry.child_jobs(root_batch_id)
+            if not child['downloaded_at'] and child['status'] != 'failed'
+        ]
+        if open_children:
+            logger.error(
+                "Repair already pending, download it first | ID=%s | ROOT_ID=%s | PENDING=%s",
+                batch_id,
+                root_batch_id,
+                ','.join(open_children),
+            )
+            return None
+
+        requests = self.requests_from_metadata(metadata, failures, model=model, structured_output=structured_output)
+        repair_metadata = {custom_id: metadata[custom_id] for custom_id in failures}
+
+        batch, uploaded_file, repair_dir = self.submit_requests(requests, repair_metadata)
+        self.registry.add_job(
+            batch.id,
+            model=model,
+            status=batch.status,
+            kind=self.kind,
+            prompt_type=job.get('prompt_type'),
+            filename_filter=job.get('filename_filter'),
+            num_sentences=len(requests),
+            system_prompt_version=job.get('system_prompt_version'),
+            input_file_id=uploaded_file.id,
+            parent_batch_id=root_batch_id,
+            structured_output=structured_output,
+            route_run_id=job.get('route_run_id'),
+            fanout_id=job.get('fanout_id'),
+        )
+        logger.info(
+            "Repair batch created | BATCH_ID=%s | PARENT_ID=%s | REQUESTS=%s | STATUS=%s",
+            batch.id,
+            root_batch_id,
+            len(requests),
+            batch.status,
+        )
+        logger.info(f"Batch files saved | DIR={repair_dir}")
+        return batch.id
+
+    def _poll(self, batch_id):
+        try:
+            return self.retrieve(batch_id)
+        except Exception as e:
+            logger.warning(f"Status poll failed | ID={batch_id} | ERROR={e}")
+            return None
+
+    def _download(self, batch_id):
+        try:
+            return self.download_results(batch_id) is not None
+        except Exception as e:
+            logger.error(f"Download failed | ID={batch_id} | ERROR={e}")
+            return False
+
+    def watch_batches(self, poll_interval=30.0, max_poll_interval=300.0, poll_workers=8, download_workers=4,
+                      max_poll_failures=5):
+        """Poll all pending registry jobs concurrently and download each one as soon as it completes.
+
+        Every batch has its own poll schedule that backs off exponentially (with jitter)
+        up to ``max_poll_interval``, so many long-running batches do not hammer the API.
+        A batch whose status cannot be retrieved ``max_poll_failures`` times in a row
+        (e.g. revoked key, unknown batch ID) is no longer watched.
+        Returns a dict batch_id -> completed/failed/expired/cancelled/unreachable.
+        """
+        batch_ids = [job['batch_id'] for job in self.registry.pending_jobs(kind=self.kind)]
+        if not batch_ids:
+            logger.info("No pending batches to watch")
+            return {}
+
+        logger.info(f"Watching batches | PENDING={len(batch_ids)}")
+
+        # batch_id -> (next poll time, current delay)
+        schedule = {batch_id: (0.0, poll_interval) for batch_id in batch_ids}
+        poll_failures = {batch_id: 0 for batch_id in batch_ids}
+        outcomes = {}
+        downloads = {}
+
+        with ThreadPoolExecutor(max_workers=poll_workers) as poll_pool, \
+                ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+            while schedule:
+                now = time.monotonic()
+                due = [batch_id for batch_id, (next_poll, _) in schedule.items() if next_poll <= now]
+                if not due:
+                    time.sleep(max(0.0, min(next_poll for next_poll, _ in schedule.values()) - now))
+                    continue
+
+                for batch_id, batch in zip(due, poll_pool.map(self._poll, due)):
+                    if batch is not None and batch.status in TERMINAL_STATUSES:
+                        del schedule[batch_id]
+                        logger.info(f"Batch finished | ID={batch_id} | STATUS={batch.status}")
+                        if batch.status in DOWNLOADABLE_STATUSES:
+                            downloads[batch_id] = (batch.status, download_pool.submit(self._download, batch_id))
+                        else:
+                            outcomes[batch_id] = batch.status
+                        continue
+                    poll_failures[batch_id] = poll_failures[batch_id] + 1 if batch is None else 0
+                    if poll_failures[batch_id] >= max_poll_failures:
+                        del schedule[batch_id]
+                        outcomes[batch_id] = "unreachable"
+                        logger.error(f"Batch unreachable, no longer watched | ID={batch_id} | FAILED_POLLS={poll_failures[batch_id]}")
+                        continue
+                    _, delay = schedule[batch_id]
+                    jittered = delay * random.uniform(0.5, 1.5)
+                    schedule[batch_id] = (time.monotonic() + jittered, min(delay * 2, max_poll_interval))
+
+            for batch_id, (status, future) in downloads.items():
+                outcomes[batch_id] = status if future.result() else "failed"
+
+        counts = {status: 0 for status in TERMINAL_STATUSES + ("unreachable",)}
+        for batch_id, status in outcomes.items():
+            counts[status] += 1
+            logger.info(f"Watch result | ID={batch_id} | RESULT={status}")
+        logger.info(
+            "Watch complete | COMPLETED=%s | FAILED=%s | EXPIRED=%s | CANCELLED=%s | UNREACHABLE=%s",
+            counts["completed"],
+            counts["failed"],
+            counts["expired"],
+            counts["cancelled"],
+            counts["unreachable"],
+        )
+        return outcomes
+
+
+class ValidationBatchManager(BatchJobManager):
+    """Validation batches: every prompt × every sentence, stored under ``validation/<model>/``."""
+
+    kind = 'validation'
+    metadata_source = 'validation'
+
+    def _job_model(self, batch_id):
+        job = self.registry.get_job(batch_id)
+        return (job or {}).get('model') or self.model
+
+    def _job_version(self, batch_id):
+        job = self.registry.get_job(batch_id)
+        return (job or {}).get('system_prompt_version') or get_system_prompt_version()
+
+    def _root_dir(self):
+        return os.path.join(self.output_folder, 'validation', self.model)
+
+    def _fanout_dir(self, fanout_id):
+        return os.path.join(self.output_folder, 'validation', 'fanout', fanout_id)
+
+    def _batch_dir(self, batch_id):
+        return os.path.join(self.output_folder, 'validation', self._job_model(batch_id), batch_id)
+
+    def _results_paths(self, batch_id):
+        system_prompt_version = self._job_version(batch_id)
+        output_dir = os.path.join(
+            self.output_folder,
+            'validation',
+            self._job_model(batch_id),
+            system_prompt_version,
+            batch_id
+        )
+        return (
+            os.path.join(output_dir, f'sts_validation_{system_prompt_version}.jsonl'),
+            os.path.join(output_dir, f'sts_validation_{system_prompt_version}.xlsx'),
+        )
+
+    def build_requests(self, sentences):
+        """One request per (sentence, prompt) pair."""
+        metadata = {}
+        requests = []
+        for sent_idx, input_sentence in enumerate(sentences, 1):
+            for prompt_idx, row in self.prompts.iterrows():
+                custom_id = f"val-s{sent_idx}-p{prompt_idx}"
+                requests.append(self.create_batch_request(custom_id, row, input_sentence))
+
+                metadata[custom_id] = {
+                    "input_sentence": input_sentence,
+                    "sentence_idx": sent_idx,
+                    "prompt_idx": prompt_idx,
+                    "prompt_type": row['Prompt type'],
+                    "prompt_instruction": row['Prompt'],
+                    "prompt_source": row['Source']
+                }
+        return requests, metadata
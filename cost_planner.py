@@ -0,0 +1,217 @@
+import json
+import logging
+from metrics import read_metrics
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a calibrated characters-per-token approximation
+    tiktoken = None
+
+# Approximation used when tiktoken is not installed
+CHARS_PER_TOKEN = 4.0
+# Chat formatting tokens added per message and per request
+MESSAGE_OVERHEAD_TOKENS = 4
+REQUEST_OVERHEAD_TOKENS = 3
+# Output tokens per request when there is no history for the model or prompt type
+DEFAULT_OUTPUT_TOKENS = 60
+# Number of recent downloaded jobs used to calibrate input estimates
+CALIBRATION_HISTORY = 20
+
+logger = logging.getLogger(__name__)
+
+
+def _load_encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+class TokenEstimator:
+    """Estimates input and output tokens of Responses API requests for one model.
+
+    Input tokens are counted with tiktoken when it is installed, otherwise
+    approximated from the character count. Either way the raw count is scaled by
+    ``calibration``, the ratio of actual to raw estimated input tokens of recently
+    downloaded jobs (per request that returned usage). Output tokens are the historical mean per prompt type.
+    """
+
+    def __init__(self, model, registry=None, output_folder=None):
+        self.model = model
+        self._encoding = _load_encoding(model)
+        self.calibration = self._input_calibration(registry) if registry is not None else 1.0
+        self._output_means = self._output_history(output_folder) if output_folder else {}
+
+    @property
+    def method(self):
+        return "tiktoken" if self._encoding is not None else "chars"
+
+    def _input_calibration(self, registry):
+        jobs = registry.estimated_jobs(self.model, limit=CALIBRATION_HISTORY)
+        # Actual usage only covers requests that returned a response, so the raw estimate
+        # is scaled to those; otherwise failed requests would pull the factor down
+        raw = sum(
+            job['estimated_input_tokens'] / (job['estimate_calibration'] or 1.0)
+            * job['usage_requests'] / job['estimated_requests']
+            for job in jobs
+        )
+        actual = sum(job['input_tokens'] for job in jobs)
+        return actual / raw if raw and actual else 1.0
+
+    def _output_history(self, output_folder):
+        """Mean output tokens per (model, prompt_type), per prompt_type and overall."""
+        totals = {}
+        for record in read_metrics(output_folder, 'output_tokens'):
+            for key in ((record['model'], record['prompt_type']), record['prompt_type'], None):
+                requests, tokens = totals.get(key, (0, 0))
+                totals[key] = (requests + record['requests'], tokens + record['output_tokens'])
+        return {key: tokens / requests for key, (requests, tokens) in totals.items() if requests}
+
+    def count_tokens(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return len(text) / CHARS_PER_TOKEN
+
+    def raw_input_tokens(self, body):
+        """Uncalibrated input tokens of a request body (messages plus structured output schema)."""
+        tokens = REQUEST_OVERHEAD_TOKENS
+        for message in body["input"]:
+            tokens += MESSAGE_OVERHEAD_TOKENS + self.count_tokens(message["content"])
+        if "text" in body:
+            tokens += self.count_tokens(json.dumps(body["text"]))
+        return tokens
+
+    def input_tokens(self, body):
+        return self.raw_input_tokens(body) * self.calibration
+
+    def output_tokens(self, prompt_type):
+        for key in ((self.model, prompt_type), prompt_type, None):
+            if key in self._output_means:
+                return self._output_means[key]
+        return DEFAULT_OUTPUT_TOKENS
+
+
+class CostPlanner:
+    """Estimates the cost of batch requests and trims them to a budget before upload.
+
+    Prices are USD per 1M tokens at the rate actually paid (i.e. Batch API prices).
+    ``strategy='trim'`` keeps the longest prefix of the requests that fits the budget,
+    so the random sample order is preserved. ``'pack'`` keeps the cheapest requests
+    first, which fits more requests but favours short sentences.
+    """
+
+    def __init__(self, registry=None, output_folder=None, input_price=None, output_price=None,
+                 max_budget=None, strategy='trim'):
+        if max_budget is not None and (input_price is None or output_price is None):
+            raise ValueError("max_budget needs input_price and output_price")
+        if strategy not in ('trim', 'pack'):
+            raise ValueError(f"Unknown budget strategy {strategy!r}, expected 'trim' or 'pack'")
+        self.registry = registry
+        self.output_folder = output_folder
+        self.input_price = input_price
+        self.output_price = output_price
+        self.max_budget = max_budget
+        self.strategy = strategy
+        self._estimators = {}
+
+    def estimator(self, model):
+        if model not in self._estimators:
+            self._estimators[model] = TokenEstimator(model, self.registry, self.output_folder)
+        return self._estimators[model]
+
+    def cost(self, input_tokens, output_tokens):
+        """USD cost of the given token counts, or None if prices are unknown."""
+        if self.input_price is None or self.output_price is None:
+            return None
+        return (input_tokens * self.input_price + output_tokens * self.output_price) / 1_000_000
+
+    def _select(self, request_costs):
+        """custom_ids (in original order) that fit the budget."""
+        if self.max_budget is None:
+            return list(request_costs)
+        ordered = list(request_costs)
+        if self.strategy == 'pack':
+            ordered = sorted(ordered, key=request_costs.get)
+        kept = set()
+        spent = 0.0
+        for custom_id in ordered:
+            if spent + request_costs[custom_id] > self.max_budget:
+                if self.strategy == 'trim':
+                    break
+                continue
+            spent += request_costs[custom_id]
+            kept.add(custom_id)
+        return [custom_id for custom_id in request_costs if custom_id in kept]
+
+    def plan(self, requests_by_model, metadata):
+        """Estimate every model's requests and trim the shared request set to the budget.
+
+        ``requests_by_model`` maps model -> batch requests with the custom_ids of
+        ``metadata``. Returns a plan dict with the kept custom_ids and per-model
+        token and cost estimates of the kept requests.
+        """
+        estimates = {}
+        for model, requests in requests_by_model.items():
+            estimator = self.estimator(model)
+            estimates[model] = {
+                request["custom_id"]: (
+                    estimator.input_tokens(request["body"]),
+                    estimator.output_tokens(metadata[request["custom_id"]]["prompt_type"]),
+                )
+                for request in requests
+            }
+
+        request_costs = {
+            custom_id: sum(self.cost(*estimates[model][custom_id]) or 0.0 for model in estimates)
+            for custom_id in metadata
+        }
+        kept = self._select(request_costs)
+
+        models = {}
+        for model, per_request in estimates.items():
+            input_tokens = round(sum(per_request[custom_id][0] for custom_id in kept))
+            output_tokens = round(sum(per_request[custom_id][1] for custom_id in kept))
+            estimator = self.estimator(model)
+            models[model] = {
+                "requests": len(kept),
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cost": self.cost(input_tokens, output_tokens),
+                "calibration": estimator.calibration,
+                "method": estimator.method,
+            }
+        costs = [m["cost"] for m in models.values()]
+        return {
+            "kept": kept,
+            "requests": len(metadata),
+            "dropped": len(metadata) - len(kept),
+            "max_budget": self.max_budget,
+            "strategy": self.strategy,
+            "total_cost": sum(costs) if None not in costs else None,
+            "models": models,
+        }
+
+
+def log_plan(plan):
+    for model, estimate in plan["models"].items():
+        logger.info(
+            "Plan | MODEL=%s | REQUESTS=%s | INPUT_TOKENS=%s | OUTPUT_TOKENS=%s | COST=%s | CALIBRATION=%.3f | METHOD=%s",
+            model,
+            estimate["requests"],
+            estimate["input_tokens"],
+            estimate["output_tokens"],
+            f"${estimate['cost']:.4f}" if estimate["cost"] is not None else "n/a",
+            estimate["calibration"],
+            estimate["method"],
+        )
+    logger.info(
+        "Plan | REQUESTS=%s | KEPT=%s | DROPPED=%s | TOTAL_COST=%s | MAX_BUDGET=%s | STRATEGY=%s",
+        plan["requests"],
+        len(plan["kept"]),
+        plan["dropped"],
+        f"${plan['total_cost']:.4f}" if plan["total_cost"] is not None else "n/a",
+        plan["max_budget"],
+        plan["strategy"],
+    )
@@ -0,0 +1,294 @@
+import os
+import csv
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+REGISTRY_FILENAME = "jobs.sqlite3"
+LEGACY_TRACKING_FILENAME = "batch_jobs.csv"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    batch_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL DEFAULT 'batch',
+    model TEXT,
+    prompt_type TEXT,
+    filename_filter TEXT,
+    num_sentences INTEGER,
+    system_prompt_version TEXT,
+    input_file_id TEXT,
+    output_file_id TEXT,
+    error_file_id TEXT,
+    status TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    downloaded_at TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    parent_batch_id TEXT REFERENCES jobs (batch_id),
+    structured_output INTEGER,
+    route_run_id TEXT,
+    fanout_id TEXT,
+    estimated_input_tokens INTEGER,
+    estimated_output_tokens INTEGER,
+    estimate_calibration REAL,
+    estimated_cost REAL,
+    estimated_requests INTEGER,
+    usage_requests INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (kind, downloaded_at, model);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+CREATE INDEX IF NOT EXISTS idx_jobs_parent ON jobs (parent_batch_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_fanout ON jobs (fanout_id);
+
+CREATE TABLE IF NOT EXISTS job_status_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL REFERENCES jobs (batch_id),
+    status TEXT NOT NULL,
+    recorded_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_batch ON job_status_history (batch_id);
+
+CREATE TABLE IF NOT EXISTS registry_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+class JobRegistry:
+    """Transactional registry of batch jobs backed by SQLite in WAL mode.
+
+    Safe to share between threads of one process, and between processes
+    working on the same output folder (writers wait on the database lock).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql, params).fetchall()]
+
+    def close(self):
+        self._conn.close()
+
+    def add_job(self, batch_id, model, status, kind='batch', prompt_type=None, filename_filter=None,
+                num_sentences=None, system_prompt_version=None, input_file_id=None, created_at=None,
+                parent_batch_id=None, structured_output=False, route_run_id=None, fanout_id=None,
+                estimated_input_tokens=None, estimated_output_tokens=None, estimate_calibration=None,
+                estimated_cost=None, estimated_requests=None):
+        """Register a newly submitted batch job.
+
+        ``parent_batch_id`` links a follow-up (repair) batch to the batch it repairs.
+        ``route_run_id`` links the batch to a sync/batch routed run (main_route.py).
+        ``fanout_id`` groups the per-model batches of one multi-model fan-out.
+        The ``estimate*`` values come from the cost planner and are compared with
+        the actual token totals once the job is downloaded; ``estimated_requests``
+        is the number of requests the estimate covers.
+        """
+        created_at = created_at or _now()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (batch_id, kind, model, prompt_type, filename_filter, num_sentences, "
+                "system_prompt_version, input_file_id, status, created_at, updated_at, parent_batch_id, "
+                "structured_output, route_run_id, fanout_id, estimated_input_tokens, estimated_output_tokens, "
+                "estimate_calibration, estimated_cost, estimated_requests) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (batch_id, kind, model, prompt_type, filename_filter, num_sentences,
+                 system_prompt_version, input_file_id, status, created_at, created_at, parent_batch_id,
+                 int(bool(structured_output)), route_run_id, fanout_id, estimated_input_tokens,
+                 estimated_output_tokens, estimate_calibration, estimated_cost, estimated_requests),
+            )
+            conn.execute(
+                "INSERT INTO job_status_history (batch_id, status, recorded_at) VALUES (?, ?, ?)",
+                (batch_id, status, created_at),
+            )
+
+    def record_status(self, batch_id, status, output_file_id=None, error_file_id=None):
+        """Store the latest status of a job; history only grows when the status changes."""
+        now = _now()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE batch_id = ?", (batch_id,)).fetchone()
+            if row is None:
+                return
+            conn.execute(
+                "UPDATE jobs SET status = ?, output_file_id = COALESCE(?, output_file_id), "
+                "error_file_id = COALESCE(?, error_file_id), updated_at = ? WHERE batch_id = ?",
+                (status, output_file_id, error_file_id, now, batch_id),
+            )
+            if row["status"] != status:
+                conn.execute(
+                    "INSERT INTO job_status_history (batch_id, status, recorded_at) VALUES (?, ?, ?)",
+                    (batch_id, status, now),
+                )
+
+    def mark_downloaded(self, batch_id, input_tokens, output_tokens, usage_requests=None):
+        """Flag a job as downloaded and store its token totals.
+
+        ``usage_requests`` is the number of requests that returned usage, i.e. that
+        the token totals cover.
+        """
+        now = _now()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET downloaded_at = ?, input_tokens = ?, output_tokens = ?, usage_requests = ?, "
+                "updated_at = ? WHERE batch_id = ?",
+                (now, input_tokens, output_tokens, usage_requests, now, batch_id),
+            )
+
+    def get_job(self, batch_id):
+        rows = self._query("SELECT * FROM jobs WHERE batch_id = ?", (batch_id,))
+        return rows[0] if rows else None
+
+    def pending_jobs(self, kind='batch', model=None):
+        """Jobs that have not been downloaded yet, oldest first.
+
+        Failed batches have no output and are left out; expired and cancelled batches
+        stay pending until their partial results are downloaded.
+        """
+        sql = "SELECT * FROM jobs WHERE kind = ? AND downloaded_at IS NULL AND (status IS NULL OR status != 'failed')"
+        params = [kind]
+        if model is not None:
+            sql += " AND model = ?"
+            params.append(model)
+        return self._query(sql + " ORDER BY created_at", params)
+
+    def downloaded_jobs(self, kind='batch', model=None):
+        """Jobs whose results have been downloaded, oldest first."""
+        sql = "SELECT * FROM jobs WHERE kind = ? AND downloaded_at IS NOT NULL"
+        params = [kind]
+        if model is not None:
+            sql += " AND model = ?"
+            params.append(model)
+        return self._query(sql + " ORDER BY created_at", params)
+
+    def child_jobs(self, batch_id):
+        """Follow-up batches linked to a parent batch, oldest first."""
+        return self._query(
+            "SELECT * FROM jobs WHERE parent_batch_id = ? ORDER BY created_at",
+            (batch_id,),
+        )
+
+    def fanout_jobs(self, fanout_id):
+        """Per-model root batches of a fan-out (repair batches excluded), ordered by model."""
+        return self._query(
+            "SELECT * FROM jobs WHERE fanout_id = ? AND parent_batch_id IS NULL ORDER BY model",
+            (fanout_id,),
+        )
+
+    def estimated_jobs(self, model, limit=20):
+        """Most recent downloaded jobs of a model with estimated and actual input tokens and request counts."""
+        return self._query(
+            "SELECT * FROM jobs WHERE model = ? AND downloaded_at IS NOT NULL "
+            "AND estimated_input_tokens IS NOT NULL AND input_tokens IS NOT NULL "
+            "AND estimated_requests > 0 AND usage_requests > 0 "
+            "ORDER BY downloaded_at DESC LIMIT ?",
+            (model, limit),
+        )
+
+    def status_history(self, batch_id):
+        return self._query(
+            "SELECT status, recorded_at FROM job_status_history WHERE batch_id = ? ORDER BY id",
+            (batch_id,),
+        )
+
+    def import_tracking_csv(self, tracking_file, kind='batch'):
+        """One-time import of a legacy semicolon-delimited ``batch_jobs.csv``.
+
+        Returns the number of imported jobs (0 if the file was imported before).
+        The model is not part of the CSV and is read from the batch requests file
+        next to it when available.
+        """
+        meta_key = f"imported:{os.path.abspath(tracking_file)}"
+        if self._query("SELECT value FROM registry_meta WHERE key = ?", (meta_key,)):
+            return 0
+
+        with open(tracking_file, 'r', newline='') as f:
+            rows = [r for r in csv.reader(f, delimiter=';') if r]
+        header = rows[0] if rows else []
+        # Older files have 5 header columns but rows with system_prompt_version appended
+        if "system_prompt_version" not in header:
+            header = header + ["system_prompt_version"]
+
+        imported = 0
+        output_dir = os.path.dirname(tracking_file)
+        with self._transaction() as conn:
+            for r in rows[1:]:
+                job = dict(zip(header, r))
+                batch_id = job.get("batch_id")
+                if not batch_id:
+                    continue
+                created_at = job.get("created_at") or _now()
+                downloaded = (job.get("downloaded") or "").strip() == "yes"
+                num_sentences = job.get("num_sentences")
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (batch_id, kind, model, filename_filter, num_sentences, "
+                    "system_prompt_version, status, created_at, updated_at, downloaded_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        batch_id,
+                        kind,
+                        _read_batch_model(os.path.join(output_dir, batch_id)),
+                        job.get("filename_filter") or None,
+                        int(num_sentences) if num_sentences and num_sentences.isdigit() else None,
+                        job.get("system_prompt_version") or None,
+                        "completed" if downloaded else None,
+                        created_at,
+                        created_at,
+                        created_at if downloaded else None,
+                    ),
+                )
+                imported += cursor.rowcount
+            conn.execute(
+                "INSERT OR IGNORE INTO registry_meta (key, value) VALUES (?, ?)",
+                (meta_key, _now()),
+            )
+        return imported
+
+
+def _read_batch_model(batch_dir):
+    """Read the model of a batch from the first line of its requests file."""
+    requests_file = os.path.join(batch_dir, 'batch_requests.jsonl')
+    if not os.path.exists(requests_file):
+        return None
+    with open(requests_file, 'r') as f:
+        first_line = f.readline()
+    if not first_line.strip():
+        return None
+    return json.loads(first_line).get('body', {}).get('model')
+
+
+def open_registry(output_folder):
+    """Open the job registry of an output folder, importing a legacy CSV on first use."""
+    output_dir = os.path.join(output_folder, 'output')
+    os.makedirs(output_dir, exist_ok=True)
+    registry = JobRegistry(os.path.join(output_dir, REGISTRY_FILENAME))
+    legacy_file = os.path.join(output_dir, LEGACY_TRACKING_FILENAME)
+    if os.path.exists(legacy_file):
+        registry.import_tracking_csv(legacy_file)
+    return registry
@@ -0,0 +1,167 @@
+import os
+import json
+import heapq
+import hashlib
+import logging
+import argparse
+from job_registry import open_registry
+
+logger = logging.getLogger(__name__)
+
+CORPUS_FILENAME = 'sts_corpus.jsonl'
+INDEX_FILENAME = 'sts_corpus_index.json'
+STATE_FILENAME = 'compaction_state.json'
+
+KEY_FIELDS = ("input_sentence", "prompt_instruction", "system_prompt_version", "model")
+
+
+def corpus_key(record):
+    """Return the dedup/sort key of a corpus record."""
+    return tuple(record.get(field) or "" for field in KEY_FIELDS)
+
+
+def corpus_key_hash(key):
+    """Stable hash of a corpus key, used as the index key."""
+    return hashlib.sha1(json.dumps(list(key)).encode('utf-8')).hexdigest()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Compact all downloaded batch outputs into a single sorted, deduplicated corpus')
+    parser.add_argument('--output-folder', type=str, default='/Volumes/Samsung PSSD T7 Media/data/ouput/sts_db',
+                        help='Path to output folder (default: /Volumes/Samsung PSSD T7 Media/data/ouput/sts_db)')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='Ignore the compaction state and rebuild the corpus from every downloaded batch')
+    return parser.parse_args(argv)
+
+
+def _load_state(state_file, rebuild):
+    if rebuild or not os.path.exists(state_file):
+        return {"compacted_batches": []}
+    with open(state_file, 'r') as f:
+        return json.load(f)
+
+
+def _load_batch_records(output_folder, job):
+    """Load the results of one batch and attach provenance fields."""
+    batch_id = job['batch_id']
+    batch_dir = os.path.join(output_folder, 'output', batch_id)
+    results_file = os.path.join(batch_dir, 'sts_database.jsonl')
+    if not os.path.exists(results_file):
+        logger.warning(f"Results file missing, skipping | BATCH_ID={batch_id} | FILE={results_file}")
+        return None
+    model = job.get('model') or ""
+    system_prompt_version = (job.get('system_prompt_version') or '').strip()
+    records = []
+    with open(results_file, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            record.setdefault('system_prompt_version', system_prompt_version)
+            record.setdefault('model', model)
+            record['batch_id'] = batch_id
+            records.append(record)
+    return records
+
+
+def _iter_corpus(corpus_file):
+    if not os.path.exists(corpus_file):
+        return
+    with open(corpus_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def compact(output_folder, rebuild=False):
+    """Merge newly downloaded batches into the compacted corpus."""
+    compacted_dir = os.path.join(output_folder, 'output/compacted')
+    corpus_file = os.path.join(compacted_dir, CORPUS_FILENAME)
+    index_file = os.path.join(compacted_dir, INDEX_FILENAME)
+    state_file = os.path.join(compacted_dir, STATE_FILENAME)
+
+    state = _load_state(state_file, rebuild)
+    compacted = set(state['compacted_batches'])
+    registry = open_registry(output_folder)
+    new_jobs = [job for job in registry.downloaded_jobs() if job['batch_id'] not in compacted]
+
+    if not new_jobs:
+        logger.info("Nothing to compact | NEW_BATCHES=0")
+        return
+
+    new_records = []
+    merged_batches = []
+    for job in new_jobs:
+        records = _load_batch_records(output_folder, job)
+        if records is None:
+            continue
+        new_records.extend(records)
+        merged_batches.append(job['batch_id'])
+        logger.info(f"Loaded batch | BATCH_ID={job['batch_id']} | ENTRIES={len(records)}")
+
+    new_records.sort(key=corpus_key)
+
+    # Stream-merge the existing (already sorted) corpus with the new records.
+    # heapq.merge is stable, so on duplicate keys the existing record wins.
+    existing = [] if rebuild else _iter_corpus(corpus_file)
+    merged = heapq.merge(existing, new_records, key=corpus_key)
+
+    index = {}
+    total = 0
+    duplicates = 0
+    previous_key = None
+    temp_corpus = corpus_file + '.tmp'
+    with open(temp_corpus, 'wb') as f:
+        for record in merged:
+            key = corpus_key(record)
+            if key == previous_key:
+                duplicates += 1
+                continue
+            previous_key = key
+            index[corpus_key_hash(key)] = f.tell()
+            f.write((json.dumps(record) + '\n').encode('utf-8'))
+            total += 1
+
+    temp_index = index_file + '.tmp'
+    with open(temp_index, 'w') as f:
+        json.dump({"key_fields": list(KEY_FIELDS), "offsets": index}, f)
+
+    os.replace(temp_corpus, corpus_file)
+    os.replace(temp_index, index_file)
+
+    state['compacted_batches'] = sorted(compacted | set(merged_batches))
+    with open(state_file, 'w') as f:
+        json.dump(state, f, indent=2)
+
+    logger.info(
+        "Compaction complete | NEW_BATCHES=%s | NEW_ENTRIES=%s | DUPLICATES=%s | TOTAL_ENTRIES=%s | CORPUS=%s",
+        len(merged_batches),
+        len(new_records),
+        duplicates,
+        total,
+        corpus_file,
+    )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Create output directories
+    os.makedirs(os.path.join(args.output_folder, 'logs'), exist_ok=True)
+    os.makedirs(os.path.join(args.output_folder, 'output/compacted'), exist_ok=True)
+
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.FileHandler(os.path.join(args.output_folder, 'logs/sts_compaction.log')),
+            logging.StreamHandler()
+        ]
+    )
+    compact(args.output_folder, rebuild=args.rebuild)
+
+
+if __name__ == '__main__':
+    main()
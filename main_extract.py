@@ -0,0 +1,170 @@
+import os
+import json
+import logging
+import argparse
+from prefilter import load_prefilter
+from utils import parse_shard, extract_shard_sample, merge_shard_samples, write_sentences_file
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Extract input sentences as hash-partitioned shards and merge them into one sample')
+    parser.add_argument('--mode', type=str, choices=['extract', 'merge'], default='extract',
+                        help='Mode: extract one shard, or merge all shards into a sentences file')
+    parser.add_argument('--data-folder', type=str, help='Path to folder containing gzipped CSV files (required for extract mode)')
+    parser.add_argument('--filename-filter', type=str, default=None, help='Substring to filter filenames')
+    parser.add_argument('--num-sentences', type=int, default=500, help='Size of the global sample (default: 500)')
+    parser.add_argument('--seed', type=int, default=42, help='Sampling seed shared by all shards (default: 42)')
+    parser.add_argument('--shard', type=str, default='0/1',
+                        help='Shard of this worker as i/N with 0 <= i < N, extract mode only (default: 0/1)')
+    parser.add_argument('--partition', type=str, choices=['files', 'rows'], default='files',
+                        help='Partition the matching files, or the rows within every file (default: files)')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='Drop implausible bodies with the vectorized prefilter before spaCy parsing (see prefilter.py)')
+    parser.add_argument('--prefilter-config', type=str, default=None,
+                        help='JSON file overriding the prefilter settings (implies --prefilter)')
+    parser.add_argument('--output-folder', type=str, default='/Volumes/Samsung PSSD T7 Media/data/ouput/sts_db',
+                        help='Path to output folder (default: /Volumes/Samsung PSSD T7 Media/data/ouput/sts_db)')
+    parser.add_argument('--shard-dir', type=str, default=None,
+                        help='Folder shared by all workers for shard files (default: <output-folder>/output/shards)')
+    parser.add_argument('--output-file', type=str, default=None,
+                        help='Merged sentences file (default: <shard-dir>/sentences.jsonl)')
+    args = parser.parse_args(argv)
+    try:
+        args.shard_index, args.num_shards = parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+    args.shard_dir = args.shard_dir or os.path.join(args.output_folder, 'output', 'shards')
+    return args
+
+
+def _shard_paths(shard_dir, shard_index, num_shards):
+    """Return the (sample jsonl, manifest json) paths of one shard."""
+    name = f"shard_{shard_index}_of_{num_shards}"
+    return os.path.join(shard_dir, f"{name}.jsonl"), os.path.join(shard_dir, f"{name}.json")
+
+
+def extract_shard(args):
+    prefilter = load_prefilter(args.prefilter_config, enabled=args.prefilter)
+    sample, stats = extract_shard_sample(
+        args.data_folder,
+        args.num_sentences,
+        shard_index=args.shard_index,
+        num_shards=args.num_shards,
+        filename_filter=args.filename_filter,
+        seed=args.seed,
+        partition=args.partition,
+        prefilter=prefilter,
+    )
+
+    sample_file, manifest_file = _shard_paths(args.shard_dir, args.shard_index, args.num_shards)
+    with open(sample_file, 'w', encoding='utf-8') as f:
+        for key, sentence in sample:
+            f.write(json.dumps({"input_sentence": sentence, "sample_key": key}) + '\n')
+    # The manifest is written last, so merge only sees shards whose sample is complete
+    with open(manifest_file, 'w') as f:
+        json.dump({
+            "shard_index": args.shard_index,
+            "num_shards": args.num_shards,
+            "seed": args.seed,
+            "num_sentences": args.num_sentences,
+            "partition": args.partition,
+            "filename_filter": args.filename_filter,
+            "prefilter": prefilter.config if prefilter else None,
+            "sampled": len(sample),
+            **stats,
+        }, f, indent=2)
+
+    logger.info(
+        "Shard extracted | SHARD=%s/%s | FILES=%s | ROWS=%s | SAMPLED=%s | FILE=%s",
+        args.shard_index,
+        args.num_shards,
+        stats["files"],
+        stats["total_rows"],
+        len(sample),
+        sample_file,
+    )
+    return sample_file
+
+
+def merge_shards(args):
+    """Merge every shard of the run into one sentences file (input for --sentences-file)."""
+    manifests = []
+    for name in sorted(os.listdir(args.shard_dir)):
+        if name.startswith('shard_') and name.endswith('.json'):
+            with open(os.path.join(args.shard_dir, name), 'r') as f:
+                manifests.append(json.load(f))
+    if not manifests:
+        logger.error(f"No shards found | DIR={args.shard_dir}")
+        return None
+    num_shards = {m["num_shards"] for m in manifests}
+    if len(num_shards) > 1:
+        logger.error(f"Shard folder mixes runs | NUM_SHARDS={','.join(str(n) for n in sorted(num_shards))}")
+        return None
+    num_shards = num_shards.pop()
+    missing = sorted(set(range(num_shards)) - {m["shard_index"] for m in manifests})
+    if missing:
+        logger.error(f"Shards missing | SHARDS={','.join(str(i) for i in missing)} | NUM_SHARDS={num_shards}")
+        return None
+
+    # All shards must have sampled with the same parameters, otherwise the merge is not a global sample
+    for field in ("seed", "num_sentences", "partition", "filename_filter", "prefilter"):
+        values = {json.dumps(m.get(field), sort_keys=True) for m in manifests}
+        if len(values) > 1:
+            logger.error(f"Shards disagree | FIELD={field} | VALUES={','.join(sorted(values))}")
+            return None
+
+    shard_samples = []
+    for shard_index in range(num_shards):
+        sample_file, _ = _shard_paths(args.shard_dir, shard_index, num_shards)
+        with open(sample_file, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        shard_samples.append([(r["sample_key"], r["input_sentence"]) for r in records])
+
+    num_sentences = manifests[0]["num_sentences"]
+    sentences = merge_shard_samples(shard_samples, num_sentences)
+    output_file = args.output_file or os.path.join(args.shard_dir, 'sentences.jsonl')
+    write_sentences_file(output_file, sentences)
+
+    logger.info(
+        "Shards merged | SHARDS=%s | SEED=%s | ROWS=%s | SENTENCES=%s | FILE=%s",
+        num_shards,
+        manifests[0]["seed"],
+        sum(m["total_rows"] for m in manifests),
+        len(sentences),
+        output_file,
+    )
+    logger.info(f"Use with --sentences-file {output_file}")
+    return output_file
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Create output directories
+    os.makedirs(os.path.join(args.output_folder, 'logs'), exist_ok=True)
+    os.makedirs(args.shard_dir, exist_ok=True)
+
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.FileHandler(os.path.join(args.output_folder, 'logs/sts_extract.log')),
+            logging.StreamHandler()
+        ]
+    )
+
+    if args.mode == 'extract':
+        if not args.data_folder:
+            logger.error("--data-folder required for extract mode")
+            return
+        extract_shard(args)
+    else:
+        merge_shards(args)
+
+
+if __name__ == '__main__':
+    main()
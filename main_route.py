@@ -0,0 +1,198 @@
+import os
+import json
+import asyncio
+import logging
+import argparse
+from datetime import datetime
+from openai import OpenAI
+from utils import extract_random_sentences_from_gzipped_csv
+from prefilter import load_prefilter
+from metrics import read_metrics
+from job_registry import open_registry
+from batch_jobs import BatchJobManager
+from sts_generator import Generator
+from main_sync import record_run_metrics
+
+# Batch API completion window; deadlines at least this long never need sync requests
+BATCH_WINDOW_HOURS = 24
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Route an STS workload between sync and Batch API execution based on a deadline')
+    parser.add_argument('--api-key', type=str, required=True, help='OpenAI API key')
+    parser.add_argument('--data-folder', type=str, required=True, help='Path to folder containing gzipped CSV files')
+    parser.add_argument('--filename-filter', type=str, default=None, help='Substring to filter filenames')
+    parser.add_argument('--num-sentences', type=int, default=500, help='Number of sentences to process (default: 500)')
+    parser.add_argument('--deadline-minutes', type=float, required=True,
+                        help='Minutes until the results are needed')
+    parser.add_argument('--model', type=str, required=True, help='OpenAI model to use')
+    parser.add_argument('--prompt-type', type=str, choices=['positive', 'negative', 'both'], default='both',
+                        help='Which prompt types to use (default: both)')
+    parser.add_argument('--output-folder', type=str, default='/Volumes/Samsung PSSD T7 Media/data/ouput/sts_db',
+                        help='Path to output folder (default: /Volumes/Samsung PSSD T7 Media/data/ouput/sts_db)')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='Drop implausible bodies with the vectorized prefilter before spaCy parsing (see prefilter.py)')
+    parser.add_argument('--prefilter-config', type=str, default=None,
+                        help='JSON file overriding the prefilter settings (implies --prefilter)')
+    parser.add_argument('--structured-output', action='store_true',
+                        help='Request JSON-schema-constrained output matching the STS record shape')
+    parser.add_argument('--sync-concurrency', type=int, default=4,
+                        help='Number of sync requests in flight at the same time (default: 4)')
+    parser.add_argument('--sync-budget-fraction', type=float, default=0.8,
+                        help='Fraction of the deadline that sync requests may use (default: 0.8)')
+    parser.add_argument('--default-sync-latency', type=float, default=5.0,
+                        help='Seconds per sync request when no latency metrics exist for the model (default: 5)')
+    parser.add_argument('--latency-history', type=int, default=5,
+                        help='Number of recent sync runs used to estimate throughput (default: 5)')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the routing plan')
+    return parser.parse_args(argv)
+
+
+def _weighted_mean(runs, field):
+    total_requests = sum(r['requests'] for r in runs)
+    return sum(r[field] * r['requests'] for r in runs) / total_requests, total_requests
+
+
+def estimate_sync_throughput(output_folder, model, concurrency, history, default_latency):
+    """Wall-clock seconds per sync request at the given concurrency.
+
+    Uses the measured ``seconds_per_request`` of the most recent runs of the model at
+    that concurrency, which includes rate limiting and other contention. Without such
+    runs, falls back to the mean request latency of the model's recent runs divided by
+    the concurrency (assumes linear scaling), then to ``default_latency`` / concurrency.
+    Returns (seconds per request, observed requests, source).
+    """
+    runs = [r for r in read_metrics(output_folder, 'sync_latency') if r.get('model') == model and r['requests']]
+    measured = [r for r in runs if r.get('concurrency') == concurrency and r.get('seconds_per_request')]
+    if measured:
+        seconds_per_request, observed = _weighted_mean(measured[-history:], 'seconds_per_request')
+        return seconds_per_request, observed, 'measured'
+    if runs:
+        latency, observed = _weighted_mean(runs[-history:], 'mean_latency_s')
+        return latency / concurrency, observed, 'latency'
+    return default_latency / concurrency, 0, 'default'
+
+
+def plan_split(num_sentences, deadline_minutes, seconds_per_request, budget_fraction):
+    """Return how many sentences go through sync requests; the rest go to the Batch API."""
+    if deadline_minutes >= BATCH_WINDOW_HOURS * 60:
+        return 0
+    sync_capacity = int(deadline_minutes * 60 * budget_fraction / seconds_per_request)
+    return min(num_sentences, sync_capacity)
+
+
+async def _write_sync_head(generator, routed_file):
+    # Batch downloads append to the same file, so each record is written as one whole line
+    with open(routed_file, 'a') as f:
+        async for entry in generator.iter_pairs():
+            f.write(json.dumps({**entry, "execution": "sync"}) + '\n')
+            f.flush()
+
+
+def route(args):
+    """Extract once, split into a sync head and a batch tail, and run both into one output."""
+    seconds_per_request, observed, source = estimate_sync_throughput(
+        args.output_folder, args.model, args.sync_concurrency, args.latency_history, args.default_sync_latency
+    )
+    sentences = extract_random_sentences_from_gzipped_csv(
+        args.data_folder,
+        num_sentences=args.num_sentences,
+        filename_filter=args.filename_filter,
+        prefilter=load_prefilter(args.prefilter_config, enabled=args.prefilter)
+    )
+    sync_count = plan_split(len(sentences), args.deadline_minutes, seconds_per_request, args.sync_budget_fraction)
+    head, tail = sentences[:sync_count], sentences[sync_count:]
+
+    run_id = datetime.now().strftime('route_%Y%m%d_%H%M%S')
+    run_dir = os.path.join(args.output_folder, 'output', 'routed', run_id)
+    routed_file = os.path.join(run_dir, 'sts_database.jsonl')
+    plan = {
+        "run_id": run_id,
+        "model": args.model,
+        "sentences": len(sentences),
+        "deadline_minutes": args.deadline_minutes,
+        "sync_seconds_per_request": seconds_per_request,
+        "throughput_source": source,
+        "throughput_observations": observed,
+        "sync_concurrency": args.sync_concurrency,
+        "sync_sentences": len(head),
+        "batch_sentences": len(tail),
+    }
+    logger.info(
+        "Routing plan | RUN_ID=%s | SENTENCES=%s | DEADLINE_MIN=%s | SECONDS_PER_REQUEST=%.2f (%s, n=%s) | SYNC=%s | BATCH=%s",
+        run_id,
+        len(sentences),
+        args.deadline_minutes,
+        seconds_per_request,
+        source,
+        observed,
+        len(head),
+        len(tail),
+    )
+    if tail and args.deadline_minutes < BATCH_WINDOW_HOURS * 60:
+        logger.warning(
+            f"Batch tail may finish after the deadline | BATCH={len(tail)} | WINDOW={BATCH_WINDOW_HOURS}h"
+        )
+    if args.dry_run:
+        return plan
+
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, 'route_plan.json'), 'w') as f:
+        json.dump(plan, f, indent=2)
+
+    # Submit the batch tail first so its completion window starts as early as possible
+    if tail:
+        manager = BatchJobManager(
+            client=OpenAI(api_key=args.api_key),
+            registry=open_registry(args.output_folder),
+            output_folder=args.output_folder,
+            model=args.model,
+            prompt_type=args.prompt_type,
+            structured_output=args.structured_output,
+        )
+        manager.create_batch(tail, filename_filter=args.filename_filter, route_run_id=run_id)
+        logger.info(f"Batch tail submitted | RUN_ID={run_id} | SENTENCES={len(tail)}")
+
+    if head:
+        generator = Generator(
+            args.model,
+            api_key=args.api_key,
+            sentences=head,
+            prompt_type=args.prompt_type,
+            structured_output=args.structured_output,
+            concurrency=args.sync_concurrency,
+        )
+        asyncio.run(_write_sync_head(generator, routed_file))
+        record_run_metrics(generator, args.output_folder, args.structured_output)
+        logger.info(f"Sync head complete | RUN_ID={run_id} | SENTENCES={len(head)}")
+
+    logger.info(f"Routed run started | RUN_ID={run_id} | OUTPUT={routed_file}")
+    if tail:
+        logger.info("Batch results are appended to the run output when downloaded (main_batch.py --mode download/watch)")
+    return plan
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Create output directories
+    os.makedirs(os.path.join(args.output_folder, 'logs'), exist_ok=True)
+    os.makedirs(os.path.join(args.output_folder, 'output/routed'), exist_ok=True)
+
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.FileHandler(os.path.join(args.output_folder, 'logs/sts_route.log')),
+            logging.StreamHandler()
+        ]
+    )
+    route(args)
+
+
+if __name__ == '__main__':
+    main()
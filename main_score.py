@@ -0,0 +1,229 @@
+import os
+import json
+import logging
+import argparse
+from datetime import datetime
+import pandas as pd
+from job_registry import open_registry
+from metrics import parse_stats_summary
+from batch_jobs import BatchJobManager, ValidationBatchManager
+from sts_generator import load_prompts
+from quality_scoring import (
+    SCORE_COLUMNS, NGRAM_SIZE, MIN_LENGTH_RATIO, MAX_LENGTH_RATIO, ScoreAggregator,
+    score_pairs, degenerate_reasons,
+)
+
+DEFAULT_GROUP_BY = "system_prompt_version,prompt_type,prompt_idx,prompt_source"
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Score downloaded STS pairs with lexical similarity metrics and flag degenerate outputs')
+    parser.add_argument('--output-folder', type=str, default='/Volumes/Samsung PSSD T7 Media/data/ouput/sts_db',
+                        help='Path to output folder (default: /Volumes/Samsung PSSD T7 Media/data/ouput/sts_db)')
+    parser.add_argument('--kind', type=str, choices=['validation', 'batch'], default='validation',
+                        help='Which downloaded jobs of the registry to score (default: validation)')
+    parser.add_argument('--model', type=str, default=None, help='Only score jobs of this model')
+    parser.add_argument('--batch-id', type=str, action='append', default=None,
+                        help='Only score this batch (repeatable)')
+    parser.add_argument('--input-file', type=str, default=None,
+                        help='Score an STS JSONL file (e.g. the compacted corpus) instead of registry jobs')
+    parser.add_argument('--group-by', type=str, default=DEFAULT_GROUP_BY,
+                        help=f'Comma-separated fields to aggregate by (default: {DEFAULT_GROUP_BY})')
+    parser.add_argument('--batch-size', type=int, default=50000, help='Pairs scored per NumPy batch (default: 50000)')
+    parser.add_argument('--ngram', type=int, default=NGRAM_SIZE, help=f'Character n-gram size (default: {NGRAM_SIZE})')
+    parser.add_argument('--min-length-ratio', type=float, default=MIN_LENGTH_RATIO,
+                        help=f'Outputs shorter than this fraction of the input are degenerate (default: {MIN_LENGTH_RATIO})')
+    parser.add_argument('--max-length-ratio', type=float, default=MAX_LENGTH_RATIO,
+                        help=f'Outputs longer than this multiple of the input are degenerate (default: {MAX_LENGTH_RATIO})')
+    parser.add_argument('--parse-stats', action='store_true',
+                        help='Only report parse failure rate and output tokens per record per system prompt version')
+    args = parser.parse_args(argv)
+    args.group_by = [column.strip() for column in args.group_by.split(',') if column.strip()]
+    return args
+
+
+def _read_jsonl(path, extra=None):
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield {**(extra or {}), **json.loads(line)}
+
+
+def iter_records(args, registry):
+    """Yield STS records from an input file or from the downloaded jobs in the registry."""
+    if args.input_file:
+        yield from _read_jsonl(args.input_file)
+        return
+
+    manager_class = ValidationBatchManager if args.kind == 'validation' else BatchJobManager
+    manager = manager_class(client=None, registry=registry, output_folder=args.output_folder, model=args.model)
+    if args.batch_id:
+        jobs = [registry.get_job(batch_id) for batch_id in args.batch_id]
+        jobs = [job for job in jobs if job]
+    else:
+        # Repair batches are merged into their parent's results, so only root jobs are read
+        jobs = [job for job in registry.downloaded_jobs(kind=args.kind, model=args.model) if not job['parent_batch_id']]
+    for job in jobs:
+        results_file = manager.results_file(job['batch_id'])
+        if not os.path.exists(results_file):
+            logger.warning(f"Results missing | ID={job['batch_id']} | FILE={results_file}")
+            continue
+        logger.info(f"Scoring batch | ID={job['batch_id']} | MODEL={job['model']}")
+        yield from _read_jsonl(results_file, {
+            "batch_id": job['batch_id'],
+            "model": job['model'],
+            "system_prompt_version": job['system_prompt_version'],
+        })
+
+
+def _batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _prompt_lookup():
+    """prompt instruction -> (prompt_idx, prompt_source) over the full prompt pool."""
+    prompts = load_prompts()
+    return {row['Prompt']: (idx, row['Source']) for idx, row in prompts.iterrows()}
+
+
+def score(args):
+    registry = open_registry(args.output_folder)
+    run_id = datetime.now().strftime('score_%Y%m%d_%H%M%S')
+    run_dir = os.path.join(args.output_folder, 'output', 'scores', run_id)
+    os.makedirs(run_dir, exist_ok=True)
+    scored_file = os.path.join(run_dir, 'scored.jsonl')
+    filtered_file = os.path.join(run_dir, 'filtered.jsonl')
+
+    # Batch outputs carry only the prompt text; map it back to its index and source
+    prompt_lookup = _prompt_lookup()
+    aggregator = ScoreAggregator(args.group_by)
+    total_pairs = 0
+    reason_counts = {}
+
+    with open(scored_file, 'w') as scored_out, open(filtered_file, 'w') as filtered_out:
+        for batch in _batches(iter_records(args, registry), args.batch_size):
+            for record in batch:
+                if 'prompt_idx' not in record and record.get('prompt_instruction') in prompt_lookup:
+                    record['prompt_idx'], record['prompt_source'] = prompt_lookup[record['prompt_instruction']]
+            inputs = [record.get('input_sentence') or '' for record in batch]
+            outputs = [record.get('output_sentence') or '' for record in batch]
+
+            scores = score_pairs(inputs, outputs, n=args.ngram)
+            reasons = degenerate_reasons(scores, outputs, args.min_length_ratio, args.max_length_ratio)
+
+            for i, record in enumerate(batch):
+                record_scores = {
+                    "char_jaccard": float(scores["char_jaccard"][i]),
+                    "token_edit_distance": int(scores["token_edit_distance"][i]),
+                    "token_edit_ratio": float(scores["token_edit_ratio"][i]),
+                    "length_ratio": float(scores["length_ratio"][i]),
+                    "is_copy": bool(scores["is_copy"][i]),
+                    "degenerate_reason": reasons[i],
+                }
+                scored_out.write(json.dumps({**record, **record_scores}) + '\n')
+                if reasons[i] is None:
+                    filtered_out.write(json.dumps(record) + '\n')
+                else:
+                    reason_counts[reasons[i]] = reason_counts.get(reasons[i], 0) + 1
+
+            frame = pd.DataFrame({column: scores[column] for column in SCORE_COLUMNS})
+            for column in args.group_by:
+                frame[column] = [record.get(column) for record in batch]
+            frame["degenerate_reason"] = reasons
+            aggregator.add(frame)
+
+            total_pairs += len(batch)
+            logger.info(f"Scored | PAIRS={total_pairs}")
+
+    if not total_pairs:
+        logger.error("No pairs to score")
+        return None
+
+    summary = aggregator.summary()
+    summary_file = os.path.join(run_dir, 'prompt_scores.xlsx')
+    summary.to_excel(summary_file, index=False)
+    summary.to_csv(os.path.join(run_dir, 'prompt_scores.csv'), index=False)
+
+    degenerate = sum(reason_counts.values())
+    logger.info(
+        "Scoring complete | PAIRS=%s | DEGENERATE=%s | EMPTY=%s | COPY=%s | LENGTH=%s | DIR=%s",
+        total_pairs,
+        degenerate,
+        reason_counts.get('empty', 0),
+        reason_counts.get('copy', 0),
+        reason_counts.get('length', 0),
+        run_dir,
+    )
+    for _, row in summary.sort_values('degenerate_rate', ascending=False).head(5).iterrows():
+        group = " | ".join(f"{column.upper()}={row[column]}" for column in args.group_by)
+        logger.info(
+            "Worst group | %s | PAIRS=%s | DEGENERATE_RATE=%.3f | COPY_RATE=%.3f | MEAN_JACCARD=%.3f",
+            group,
+            row['pairs'],
+            row['degenerate_rate'],
+            row['copy_rate'],
+            row['mean_char_jaccard'],
+        )
+    return run_dir
+
+
+def report_parse_stats(args):
+    """Log and save the recorded parse stats per system prompt version, model and output mode."""
+    summary = parse_stats_summary(args.output_folder)
+    if summary.empty:
+        logger.error("No parse stats recorded yet (written by main_sync.py runs and batch downloads)")
+        return None
+    if args.model:
+        summary = summary[summary['model'] == args.model]
+
+    summary_file = os.path.join(args.output_folder, 'output', 'metrics', 'parse_stats_summary.csv')
+    summary.to_csv(summary_file, index=False)
+    for _, row in summary.iterrows():
+        logger.info(
+            "Parse stats | SYSTEM_PROMPT=%s | MODEL=%s | STRUCTURED=%s | REQUESTS=%s | PARSE_FAILURES=%s | FAILURE_RATE=%.3f | OUTPUT_TOKENS_PER_RECORD=%.1f",
+            row['system_prompt_version'],
+            row['model'],
+            row['structured_output'],
+            row['requests'],
+            row['parse_failures'],
+            row['parse_failure_rate'],
+            row['output_tokens_per_record'],
+        )
+    logger.info(f"Parse stats saved | FILE={summary_file}")
+    return summary_file
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Create output directories
+    os.makedirs(os.path.join(args.output_folder, 'logs'), exist_ok=True)
+    os.makedirs(os.path.join(args.output_folder, 'output/scores'), exist_ok=True)
+
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.FileHandler(os.path.join(args.output_folder, 'logs/sts_scoring.log')),
+            logging.StreamHandler()
+        ]
+    )
+    if args.parse_stats:
+        report_parse_stats(args)
+    else:
+        score(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,140 +1,126 @@
 import os
-import pandas as pd
 import json
+import asyncio
 import logging
 import argparse
-from openai import OpenAI
-from utils import extract_random_sentences_from_gzipped_csv
-from system_prompt import get_system_prompt
-
-# Parse command line arguments
-parser = argparse.ArgumentParser(description='Generate STS sentence pairs using OpenAI')
-parser.add_argument('--api-key', type=str, required=True, help='OpenAI API key')
-parser.add_argument('--data-folder', type=str, required=True, help='Path to folder containing gzipped CSV files')
-parser.add_argument('--filename-filter', type=str, default=None, help='Substring to filter filenames')
-parser.add_argument('--num-sentences', type=int, default=500, help='Number of sentences to process (default: 500)')
-parser.add_argument('--model', type=str, required=True, help='OpenAI model to use')
-parser.add_argument('--prompt-type', type=str, choices=['positive', 'negative', 'both'], default='both',
-                    help='Which prompt types to use (default: both)')
-parser.add_argument('--output-folder', type=str, default='/Volumes/Samsung PSSD T7 Media/data/ouput/sts_db',
-                    help='Path to output folder (default: /Volumes/Samsung PSSD T7 Media/data/ouput/sts_db)')
-args = parser.parse_args()
-
-
-# Create output directories
-os.makedirs(os.path.join(args.output_folder, 'logs/sync'), exist_ok=True)
-os.makedirs(os.path.join(args.output_folder, 'output/sync'), exist_ok=True)
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s | %(levelname)-8s | %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S',
-    handlers=[
-        logging.FileHandler(os.path.join(args.output_folder, 'logs/sync/sts_generation.log')),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
-
-# Initialize the client
-client = OpenAI(api_key=args.api_key)
-
-# Load your cleaned CSV
-df = pd.read_csv('prompts/prompts.csv', sep=';')
-
-# Separate prompts by type
-positive_prompts = df[df['Prompt type'] == 'Positive']
-hard_negative_prompts = df[df['Prompt type'] == 'Hard negative']
-
-
-def generate_sts_pair(row, text_input):
-    prompt_instruction = row['Prompt']
-    prompt_type = row['Prompt type']
-
-    system_content = get_system_prompt(prompt_instruction, prompt_type)
-
-    logger.info(f"PROMPT_TYPE={prompt_type} | INSTRUCTION={prompt_instruction[:80]}...")
-    logger.info(f"INPUT={text_input[:100]}...")
-
-    try:
-        request_kwargs = {
-            "model": args.model,
-            "input": [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": text_input}
-            ],
-        }
-        if args.model == "gpt-5.2":
-            request_kwargs["reasoning"] = {"effort": "medium"}
-        else:
-            request_kwargs["temperature"] = 0.7  # Slight randomness helps with STS diversity
-
-        response = client.responses.create(**request_kwargs)
-        
-        # Parse the response to ensure it's valid JSON
-        result = response.output_text
-        parsed_result = json.loads(result)
-        # Add prompt metadata to the result
-        parsed_result['prompt_type'] = prompt_type
-        parsed_result['prompt_instruction'] = prompt_instruction
-        parsed_result['input_sentence'] = text_input
-        
-        # Extract token usage
-        input_tokens = getattr(response.usage, "input_tokens", 0) or getattr(response.usage, "prompt_tokens", 0)
-        output_tokens = getattr(response.usage, "output_tokens", 0) or getattr(response.usage, "completion_tokens", 0)
-        
-        logger.info(f"OUTPUT={parsed_result.get('output_sentence', '')[:100]}...")
-        return parsed_result, input_tokens, output_tokens
-    
-    except Exception as e:
-        logger.error(f"ERROR={e}")
-        return None, 0, 0
-
-# Load input sentences from gzipped CSV files (first sentence from each Body)
-results_database = []
-
-# Get random sentences from gzipped files
-sentences = extract_random_sentences_from_gzipped_csv(
-    args.data_folder, 
-    num_sentences=args.num_sentences, 
-    filename_filter=args.filename_filter
-)
-
-logger.info(f"Starting STS generation | SENTENCES={args.num_sentences} | FILE_FILTER={args.filename_filter}")
-
-# Token tracking
-total_input_tokens = 0
-total_output_tokens = 0
-
-# Process each sentence
-for idx, input_sentence in enumerate(sentences, 1):
-    logger.info(f"--- Processing {idx}/{len(sentences)} ---")
-    
-    # Select prompt type
-    if args.prompt_type == 'positive':
-        row = positive_prompts.sample(1).iloc[0]
-    elif args.prompt_type == 'negative':
-        row = hard_negative_prompts.sample(1).iloc[0]
-    else:
-        # Alternate between Positive and Hard negative
-        if idx % 2 == 1:
-            row = positive_prompts.sample(1).iloc[0]
-        else:
-            row = hard_negative_prompts.sample(1).iloc[0]
-    
-    output, input_tokens, output_tokens = generate_sts_pair(row, input_sentence)
-    total_input_tokens += input_tokens
-    total_output_tokens += output_tokens
-    
-    if output:
-        results_database.append(output)
-
-# Save database
-output_file = os.path.join(args.output_folder, 'output/sync/sts_database.jsonl')
-with open(output_file, 'w') as f:
-    for entry in results_database:
-        f.write(json.dumps(entry) + '\n')
-
-logger.info(f"Database generation complete | TOTAL_ENTRIES={len(results_database)} | OUTPUT_FILE={output_file}")
-logger.info(f"Token usage | INPUT_TOKENS={total_input_tokens} | OUTPUT_TOKENS={total_output_tokens} | TOTAL_TOKENS={total_input_tokens + total_output_tokens}")
+import statistics
+from utils import read_sentences_file
+from system_prompt import get_system_prompt_version
+from metrics import append_metric
+from prefilter import load_prefilter
+from sts_generator import Generator
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate STS sentence pairs using OpenAI')
+    parser.add_argument('--api-key', type=str, required=True, help='OpenAI API key')
+    parser.add_argument('--data-folder', type=str, help='Path to folder containing gzipped CSV files')
+    parser.add_argument('--sentences-file', type=str, default=None,
+                        help='JSONL file of pre-extracted input sentences (used instead of --data-folder)')
+    parser.add_argument('--output-file', type=str, default=None,
+                        help='Path of the output JSONL (default: <output-folder>/output/sync/sts_database.jsonl)')
+    parser.add_argument('--filename-filter', type=str, default=None, help='Substring to filter filenames')
+    parser.add_argument('--num-sentences', type=int, default=500, help='Number of sentences to process (default: 500)')
+    parser.add_argument('--model', type=str, required=True, help='OpenAI model to use')
+    parser.add_argument('--prompt-type', type=str, choices=['positive', 'negative', 'both'], default='both',
+                        help='Which prompt types to use (default: both)')
+    parser.add_argument('--output-folder', type=str, default='/Volumes/Samsung PSSD T7 Media/data/ouput/sts_db',
+                        help='Path to output folder (default: /Volumes/Samsung PSSD T7 Media/data/ouput/sts_db)')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='Drop implausible bodies with the vectorized prefilter before spaCy parsing (see prefilter.py)')
+    parser.add_argument('--prefilter-config', type=str, default=None,
+                        help='JSON file overriding the prefilter settings (implies --prefilter)')
+    parser.add_argument('--structured-output', action='store_true',
+                        help='Request JSON-schema-constrained output matching the STS record shape')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of requests in flight at the same time (default: 1)')
+    args = parser.parse_args(argv)
+    if not args.data_folder and not args.sentences_file:
+        parser.error("one of --data-folder or --sentences-file is required")
+    return args
+
+
+def record_run_metrics(generator, output_folder, structured_output):
+    """Append parse stats and latency metrics of a finished generator run."""
+    logger = logging.getLogger(__name__)
+    stats = generator.parse_stats.summary()
+    append_metric(output_folder, 'parse_stats', {
+        "source": "sync",
+        "model": generator.model,
+        "system_prompt_version": get_system_prompt_version(),
+        "structured_output": structured_output,
+        **stats,
+    })
+    logger.info(f"Parse stats | REQUESTS={stats['requests']} | PARSE_FAILURES={stats['parse_failures']} | FAILURE_RATE={stats['parse_failure_rate']:.3f} | OUTPUT_TOKENS_PER_RECORD={stats['output_tokens_per_record']}")
+
+    # Latency metrics feed the sync/batch router (main_route.py)
+    latencies = generator.request_latencies
+    wall_time_s = generator.generation_time_s
+    if latencies:
+        sorted_latencies = sorted(latencies)
+        append_metric(output_folder, 'sync_latency', {
+            "model": generator.model,
+            "requests": len(latencies),
+            "concurrency": generator.concurrency,
+            "mean_latency_s": statistics.fmean(latencies),
+            "median_latency_s": statistics.median(latencies),
+            "p90_latency_s": sorted_latencies[int(0.9 * (len(sorted_latencies) - 1))],
+            # Wall-clock throughput including concurrency, used for capacity planning
+            "seconds_per_request": wall_time_s / len(latencies),
+        })
+        logger.info(f"Latency | REQUESTS={len(latencies)} | MEAN_S={statistics.fmean(latencies):.2f} | MEDIAN_S={statistics.median(latencies):.2f} | SECONDS_PER_REQUEST={wall_time_s / len(latencies):.2f}")
+
+
+async def write_pairs(generator, output_file):
+    """Stream generated records into a JSONL file; returns the number of records."""
+    total_entries = 0
+    with open(output_file, 'w') as f:
+        async for entry in generator.iter_pairs():
+            f.write(json.dumps(entry) + '\n')
+            total_entries += 1
+    return total_entries
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # Create output directories
+    os.makedirs(os.path.join(args.output_folder, 'logs/sync'), exist_ok=True)
+    os.makedirs(os.path.join(args.output_folder, 'output/sync'), exist_ok=True)
+
+    # Configure logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        handlers=[
+            logging.FileHandler(os.path.join(args.output_folder, 'logs/sync/sts_generation.log')),
+            logging.StreamHandler()
+        ]
+    )
+    logger = logging.getLogger(__name__)
+
+    generator = Generator(
+        args.model,
+        api_key=args.api_key,
+        data_folder=args.data_folder,
+        filename_filter=args.filename_filter,
+        num_sentences=args.num_sentences,
+        sentences=read_sentences_file(args.sentences_file) if args.sentences_file else None,
+        prefilter=load_prefilter(args.prefilter_config, enabled=args.prefilter),
+        prompt_type=args.prompt_type,
+        structured_output=args.structured_output,
+        concurrency=args.concurrency,
+    )
+
+    output_file = args.output_file or os.path.join(args.output_folder, 'output/sync/sts_database.jsonl')
+    total_entries = asyncio.run(write_pairs(generator, output_file))
+
+    logger.info(f"Database generation complete | TOTAL_ENTRIES={total_entries} | OUTPUT_FILE={output_file}")
+    logger.info(f"Token usage | INPUT_TOKENS={generator.total_input_tokens} | OUTPUT_TOKENS={generator.total_output_tokens} | TOTAL_TOKENS={generator.total_input_tokens + generator.total_output_tokens}")
+
+    record_run_metrics(generator, args.output_folder, args.structured_output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import os
+import json
+from datetime import datetime
+
+import pandas as pd
+
+
+def _metrics_file(output_folder, name):
+    metrics_dir = os.path.join(output_folder, 'output', 'metrics')
+    os.makedirs(metrics_dir, exist_ok=True)
+    return os.path.join(metrics_dir, f'{name}.jsonl')
+
+
+def append_metric(output_folder, name, record):
+    """Append one timestamped record to ``output/metrics/<name>.jsonl``."""
+    record = {"recorded_at": datetime.now().isoformat(timespec='seconds'), **record}
+    with open(_metrics_file(output_folder, name), 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+def read_metrics(output_folder, name):
+    """Read all records of a metrics file (empty list if it does not exist)."""
+    path = _metrics_file(output_folder, name)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ParseStats:
+    """Counts parse failures and output tokens of one run."""
+
+    def __init__(self):
+        self.requests = 0
+        self.parse_failures = 0
+        self.output_tokens = 0
+
+    def add(self, parsed, output_tokens):
+        self.requests += 1
+        self.output_tokens += output_tokens
+        if not parsed:
+            self.parse_failures += 1
+
+    def summary(self):
+        records = self.requests - self.parse_failures
+        return {
+            "requests": self.requests,
+            "parse_failures": self.parse_failures,
+            "parse_failure_rate": self.parse_failures / self.requests if self.requests else 0.0,
+            "output_tokens": self.output_tokens,
+            # Tokens spent on failed outputs are included, so waste shows up here
+            "output_tokens_per_record": self.output_tokens / records if records else None,
+        }
+
+
+def parse_stats_summary(output_folder):
+    """Aggregate recorded parse stats per system prompt version, model and output mode."""
+    records = read_metrics(output_folder, 'parse_stats')
+    if not records:
+        return pd.DataFrame()
+    stats_df = pd.DataFrame(records)
+    summary = stats_df.groupby(['system_prompt_version', 'model', 'structured_output'])[
+        ['requests', 'parse_failures', 'output_tokens']
+    ].sum()
+    records_ok = summary['requests'] - summary['parse_failures']
+    summary['parse_failure_rate'] = summary['parse_failures'] / summary['requests']
+    summary['output_tokens_per_record'] = summary['output_tokens'] / records_ok.where(records_ok > 0)
+    return summary.reset_index()
@@ -0,0 +1,114 @@
+import json
+import pandas as pd
+
+# Rows are buffered and filtered in chunks of this many bodies
+PREFILTER_CHUNK_ROWS = 5000
+
+# Regex rejects, anchored at the start of the body (re.match on the first scan_chars characters)
+DEFAULT_REJECT_PATTERNS = {
+    # Bodies that open with a pipe- or tab-separated table row (4+ separators on the first line)
+    "table": r"(?:[^|\t\n]*[|\t]){4}",
+    # Bodies that are nothing but ticker symbols, e.g. "<AAPL.O> <MSFT.O>"
+    "ticker_only": r"^\s*(?:[<(]?[A-Z]{1,5}(?:\.[A-Z]{1,2})?[>)]?(?:[\s,;/]+|$))+$",
+    # Bodies that are nothing but a dateline, e.g. "NEW YORK (Reuters) -"
+    "dateline_only": r"^\s*[A-Z][A-Za-z .,/'-]*\((?:Reuters|AP|AFP|Bloomberg)\)\s*[-–—]?\s*$",
+}
+
+# Frequent English function words for the language heuristic
+_STOPWORDS = (
+    "the", "a", "an", "of", "and", "or", "to", "in", "on", "at", "for", "with", "by", "from",
+    "is", "are", "was", "were", "be", "has", "have", "had", "it", "its", "that", "this", "as", "will", "said",
+)
+
+DEFAULT_CONFIG = {
+    "enabled": True,
+    "min_chars": 20,
+    "max_chars": 100000,
+    "scan_chars": 2000,
+    "max_non_ascii_ratio": 0.1,
+    "min_alpha_ratio": 0.6,
+    "max_digit_ratio": 0.3,
+    "max_upper_ratio": 0.7,
+    "min_stopword_ratio": 0.05,
+    "min_words_for_stopwords": 10,
+    "reject_patterns": DEFAULT_REJECT_PATTERNS,
+}
+
+
+class Prefilter:
+    """Cheap vectorized checks that reject implausible bodies before spaCy parsing.
+
+    Rules run in order on a whole chunk of bodies; each rejected body is counted
+    under the first rule it fails. Set a threshold to None to disable that rule.
+    Ratios are computed on the first ``scan_chars`` characters and relative to
+    non-whitespace characters (letters for ``max_upper_ratio``, words for
+    ``min_stopword_ratio``).
+    """
+
+    def __init__(self, **config):
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown prefilter settings: {', '.join(sorted(unknown))}")
+        self.config = {**DEFAULT_CONFIG, **config}
+        self.enabled = self.config["enabled"]
+        self._stopword_pattern = r"\b(?:" + "|".join(_STOPWORDS) + r")\b"
+
+    @property
+    def rule_names(self):
+        names = ["too_short", "too_long", *self.config["reject_patterns"], "non_ascii", "low_alpha",
+                 "high_digit", "high_upper", "no_stopwords"]
+        return names if self.enabled else []
+
+    def _rule_masks(self, bodies):
+        """Yield (rule name, boolean rejection mask) in evaluation order."""
+        c = self.config
+        lengths = bodies.str.len()
+        yield "too_short", lengths < c["min_chars"] if c["min_chars"] is not None else None
+        yield "too_long", lengths > c["max_chars"] if c["max_chars"] is not None else None
+
+        head = bodies.str.slice(0, c["scan_chars"])
+        for name, pattern in c["reject_patterns"].items():
+            # Only the lead sentence is used, so later tables or lists in the body do not matter
+            yield name, head.str.match(pattern)
+
+        non_space = head.str.count(r"\S").clip(lower=1)
+        letters = head.str.count(r"[A-Za-z]")
+        if c["max_non_ascii_ratio"] is not None:
+            yield "non_ascii", head.str.count(r"[^\x00-\x7f]") / non_space > c["max_non_ascii_ratio"]
+        if c["min_alpha_ratio"] is not None:
+            yield "low_alpha", letters / non_space < c["min_alpha_ratio"]
+        if c["max_digit_ratio"] is not None:
+            yield "high_digit", head.str.count(r"\d") / non_space > c["max_digit_ratio"]
+        if c["max_upper_ratio"] is not None:
+            yield "high_upper", head.str.count(r"[A-Z]") / letters.clip(lower=1) > c["max_upper_ratio"]
+        if c["min_stopword_ratio"] is not None:
+            words = head.str.count(r"\S+")
+            stopwords = head.str.lower().str.count(self._stopword_pattern)
+            yield "no_stopwords", (words >= c["min_words_for_stopwords"]) & (
+                stopwords / words.clip(lower=1) < c["min_stopword_ratio"]
+            )
+
+    def filter(self, bodies, stats):
+        """Return the bodies that pass every rule; rejection counts are added to ``stats``."""
+        if not self.enabled or not bodies:
+            return bodies
+        series = pd.Series(bodies, dtype=object)
+        keep = pd.Series(True, index=series.index)
+        for name, mask in self._rule_masks(series):
+            if mask is None:
+                continue
+            key = f"prefilter_{name}"
+            stats[key] = stats.get(key, 0) + int((keep & mask).sum())
+            keep &= ~mask
+        return series[keep].tolist()
+
+
+def load_prefilter(config_file=None, enabled=True):
+    """Build a Prefilter from the defaults, overridden by a JSON config file if given.
+
+    Returns None (no prefiltering) when not ``enabled`` and no config file is given.
+    """
+    if not config_file:
+        return Prefilter() if enabled else None
+    with open(config_file, 'r') as f:
+        return Prefilter(**json.load(f))
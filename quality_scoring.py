@@ -0,0 +1,187 @@
+import re
+import numpy as np
+import pandas as pd
+
+# Defaults for the scoring batch
+NGRAM_SIZE = 3
+MAX_CHARS = 512
+MAX_TOKENS = 64
+# n-gram sets are compared in chunks of this many pairs of similar length
+NGRAM_CHUNK_ROWS = 4096
+
+# Outputs outside these bounds (output chars / input chars) are flagged as degenerate
+MIN_LENGTH_RATIO = 0.3
+MAX_LENGTH_RATIO = 3.0
+
+SCORE_COLUMNS = ["char_jaccard", "token_edit_distance", "token_edit_ratio", "length_ratio", "is_copy"]
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_NORMALIZE_RE = re.compile(r"[^\w]+")
+# Padding of the n-gram hash rows, sorted after every real hash
+_NO_NGRAM = np.iinfo(np.uint64).max
+
+
+def _normalize(text):
+    """Lowercase and drop punctuation/whitespace differences, for copy detection."""
+    return _NORMALIZE_RE.sub(" ", text.lower()).strip()
+
+
+def _encode_chars(texts, max_chars):
+    """Code points of the lowercased texts as a zero-padded (batch, width) array plus lengths.
+
+    ``width`` is the length of the longest text of the batch, capped at ``max_chars``.
+    """
+    lowered = [text.lower()[:max_chars] for text in texts]
+    width = max((len(text) for text in lowered), default=0)
+    codes = np.zeros((len(texts), width), dtype=np.uint32)
+    lengths = np.zeros(len(texts), dtype=np.int64)
+    for row, text in enumerate(lowered):
+        # Lone surrogates (json.loads accepts them) are kept as their code point
+        encoded = np.frombuffer(text.encode("utf-32-le", errors="surrogatepass"), dtype=np.uint32)
+        codes[row, :len(encoded)] = encoded
+        lengths[row] = len(encoded)
+    return codes, lengths
+
+
+def _ngram_hashes(texts, n, max_chars):
+    """Sorted unique 64-bit n-gram hashes per text; padding holds ``_NO_NGRAM``.
+
+    Returns the (texts, positions) hash matrix and the number of unique n-grams per text.
+    """
+    codes, lengths = _encode_chars(texts, max_chars)
+    positions = max(codes.shape[1] - n + 1, 0)
+    hashes = np.zeros((len(texts), positions), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for k in range(n):
+            hashes = hashes * np.uint64(1000003) + codes[:, k:k + positions]
+    valid = np.arange(positions)[None, :] < (lengths - n + 1)[:, None]
+    hashes[~valid] = _NO_NGRAM
+    hashes.sort(axis=1)
+    repeated = np.zeros_like(valid)
+    repeated[:, 1:] = hashes[:, 1:] == hashes[:, :-1]
+    hashes[repeated] = _NO_NGRAM
+    hashes.sort(axis=1)
+    return hashes, (hashes != _NO_NGRAM).sum(axis=1)
+
+
+def _jaccard_chunk(a_texts, b_texts, n, max_chars):
+    a_hashes, a_sizes = _ngram_hashes(a_texts, n, max_chars)
+    b_hashes, b_sizes = _ngram_hashes(b_texts, n, max_chars)
+    # Both rows are free of repeats, so a shared n-gram is an adjacent equal pair once merged
+    merged = np.sort(np.concatenate([a_hashes, b_hashes], axis=1), axis=1)
+    shared = (merged[:, 1:] == merged[:, :-1]) & (merged[:, 1:] != _NO_NGRAM)
+    intersection = shared.sum(axis=1)
+    union = a_sizes + b_sizes - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1), 1.0)
+
+
+def char_ngram_jaccard(a_texts, b_texts, n=NGRAM_SIZE, max_chars=MAX_CHARS, chunk_rows=NGRAM_CHUNK_ROWS):
+    """Jaccard similarity of the character n-gram sets of each pair (1.0 if both are empty).
+
+    N-grams are compared by 64-bit hash, so the result is exact up to hash collisions.
+    Pairs are sorted by length and compared ``chunk_rows`` at a time, so each chunk is
+    only padded to its own longest text.
+    """
+    jaccard = np.ones(len(a_texts))
+    order = np.argsort([max(len(a), len(b)) for a, b in zip(a_texts, b_texts)], kind="stable")
+    for start in range(0, len(a_texts), chunk_rows):
+        rows = order[start:start + chunk_rows]
+        jaccard[rows] = _jaccard_chunk([a_texts[i] for i in rows], [b_texts[i] for i in rows], n, max_chars)
+    return jaccard
+
+
+def _encode_tokens(a_texts, b_texts, max_tokens):
+    """Token ids of both sides (shared vocabulary), padded with -1, plus token counts."""
+    vocab = {}
+    encoded = []
+    for texts in (a_texts, b_texts):
+        ids = np.full((len(texts), max_tokens), -1, dtype=np.int64)
+        lengths = np.zeros(len(texts), dtype=np.int64)
+        for row, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())[:max_tokens]
+            ids[row, :len(tokens)] = [vocab.setdefault(token, len(vocab)) for token in tokens]
+            lengths[row] = len(tokens)
+        encoded.append((ids, lengths))
+    return encoded
+
+
+def token_edit_distance(a_texts, b_texts, max_tokens=MAX_TOKENS):
+    """Levenshtein distance over word tokens for each pair, computed row by row for the whole batch.
+
+    Returns (distances, a token counts, b token counts). Texts are cut to ``max_tokens`` tokens.
+    """
+    (a_ids, a_lengths), (b_ids, b_lengths) = _encode_tokens(a_texts, b_texts, max_tokens)
+    batch = len(a_texts)
+    # Only as many rows and columns as the longest sentence of the batch needs
+    width = int(b_lengths.max(initial=0))
+    b_ids = b_ids[:, :width]
+    columns = np.arange(width + 1, dtype=np.int64)
+    previous = np.broadcast_to(columns, (batch, width + 1)).copy()
+    distances = previous[np.arange(batch), b_lengths].copy()  # rows with an empty a side
+    for i in range(1, int(a_lengths.max(initial=0)) + 1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        substitution = previous[:, :-1] + (a_ids[:, i - 1, None] != b_ids)
+        deletion = previous[:, 1:] + 1
+        current[:, 1:] = np.minimum(substitution, deletion)
+        # Insertions: current[j] = min over k <= j of current[k] + (j - k)
+        current = np.minimum.accumulate(current - columns, axis=1) + columns
+        done = a_lengths == i
+        distances[done] = current[done, b_lengths[done]]
+        previous = current
+    return distances, a_lengths, b_lengths
+
+
+def score_pairs(input_sentences, output_sentences, n=NGRAM_SIZE, max_chars=MAX_CHARS, max_tokens=MAX_TOKENS):
+    """Lexical similarity scores of a batch of (input, output) pairs as a dict of NumPy arrays."""
+    jaccard = char_ngram_jaccard(input_sentences, output_sentences, n, max_chars)
+    distances, input_tokens, output_tokens = token_edit_distance(input_sentences, output_sentences, max_tokens)
+    input_chars = np.array([len(text) for text in input_sentences], dtype=np.float64)
+    output_chars = np.array([len(text) for text in output_sentences], dtype=np.float64)
+    is_copy = np.array([_normalize(a) == _normalize(b) for a, b in zip(input_sentences, output_sentences)])
+    return {
+        "char_jaccard": jaccard,
+        "token_edit_distance": distances,
+        "token_edit_ratio": distances / np.maximum(np.maximum(input_tokens, output_tokens), 1),
+        "length_ratio": output_chars / np.maximum(input_chars, 1),
+        "is_copy": is_copy,
+    }
+
+
+def degenerate_reasons(scores, output_sentences, min_length_ratio=MIN_LENGTH_RATIO,
+                       max_length_ratio=MAX_LENGTH_RATIO):
+    """Reason an output is unusable ('empty', 'copy', 'length'), or None, per pair."""
+    empty = np.array([not text.strip() for text in output_sentences])
+    length = (scores["length_ratio"] < min_length_ratio) | (scores["length_ratio"] > max_length_ratio)
+    reasons = np.select([empty, scores["is_copy"], length], ["empty", "copy", "length"], default="")
+    return [reason or None for reason in reasons]
+
+
+class ScoreAggregator:
+    """Running per-group means and degenerate rates, so millions of pairs never sit in memory at once."""
+
+    def __init__(self, group_columns):
+        self.group_columns = list(group_columns)
+        self._partials = []
+
+    def add(self, frame):
+        """Add a scored batch (group columns, SCORE_COLUMNS and ``degenerate_reason``)."""
+        frame = frame.assign(
+            pairs=1,
+            degenerate=frame["degenerate_reason"].notna(),
+            is_copy=frame["is_copy"].astype(int),
+        )
+        # Missing group values (e.g. records without prompt_idx) form their own group
+        sums = frame.groupby(self.group_columns, dropna=False)[SCORE_COLUMNS + ["pairs", "degenerate"]].sum()
+        self._partials.append(sums)
+
+    def summary(self):
+        if not self._partials:
+            return pd.DataFrame()
+        totals = pd.concat(self._partials).groupby(level=self.group_columns, dropna=False).sum()
+        summary = pd.DataFrame({"pairs": totals["pairs"]})
+        for column in SCORE_COLUMNS:
+            name = "copy_rate" if column == "is_copy" else f"mean_{column}"
+            summary[name] = totals[column] / totals["pairs"]
+        summary["degenerate_rate"] = totals["degenerate"] / totals["pairs"]
+        return summary.reset_index()
@@ -0,0 +1,46 @@
+import json
+
+# JSON schema of a generated STS record. Only the model-written fields are part of
+# the schema; input/prompt metadata is attached by the scripts after parsing.
+STS_RECORD_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "output_sentence": {"type": "string"},
+    },
+    "required": ["output_sentence"],
+    "additionalProperties": False,
+}
+
+
+class OutputParseError(ValueError):
+    """Raised when a model output is not a valid STS record."""
+
+
+def text_format():
+    """Responses API ``text`` parameter that constrains the output to STS_RECORD_SCHEMA."""
+    return {
+        "format": {
+            "type": "json_schema",
+            "name": "sts_record",
+            "schema": STS_RECORD_SCHEMA,
+            "strict": True,
+        }
+    }
+
+
+def parse_sts_output(content):
+    """Parse and validate a model output string into an STS record dict.
+
+    Shared by all scripts so every path rejects the same malformed outputs.
+    Extra keys (e.g. ``entity_replacements`` from older prompt versions) are kept.
+    """
+    try:
+        parsed = json.loads(content)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise OutputParseError(f"invalid JSON: {e}") from e
+    if not isinstance(parsed, dict):
+        raise OutputParseError(f"expected a JSON object, got {type(parsed).__name__}")
+    output_sentence = parsed.get("output_sentence")
+    if not isinstance(output_sentence, str) or not output_sentence.strip():
+        raise OutputParseError("missing or empty 'output_sentence'")
+    return parsed
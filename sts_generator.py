@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import logging
+import pandas as pd
+from openai import AsyncOpenAI
+from utils import extract_random_sentences_from_gzipped_csv
+from system_prompt import get_system_prompt
+from structured_output import text_format, parse_sts_output, OutputParseError
+from metrics import ParseStats
+
+PROMPTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts', 'prompts.csv')
+
+logger = logging.getLogger(__name__)
+
+
+def load_prompts(prompts_file=PROMPTS_FILE, prompt_type='both'):
+    """Load the prompt pool, optionally restricted to one prompt type."""
+    df = pd.read_csv(prompts_file, sep=';')
+    if prompt_type == 'positive':
+        df = df[df['Prompt type'] == 'Positive']
+    elif prompt_type == 'negative':
+        df = df[df['Prompt type'] == 'Hard negative']
+    return df.reset_index(drop=True)
+
+
+def select_prompt(prompts, idx, prompt_type='both'):
+    """Sample a prompt row for the idx-th (1-based) sentence.
+
+    With ``prompt_type='both'`` odd sentences get a positive prompt and even
+    sentences a hard negative one.
+    """
+    if prompt_type == 'positive':
+        pool = prompts[prompts['Prompt type'] == 'Positive']
+    elif prompt_type == 'negative':
+        pool = prompts[prompts['Prompt type'] == 'Hard negative']
+    elif idx % 2 == 1:
+        pool = prompts[prompts['Prompt type'] == 'Positive']
+    else:
+        pool = prompts[prompts['Prompt type'] == 'Hard negative']
+    return pool.sample(1).iloc[0]
+
+
+def build_request_body(model, row, text_input, structured_output=False):
+    """Build the Responses API request body for one prompt row and input sentence."""
+    system_content = get_system_prompt(row['Prompt'], row['Prompt type'])
+    body = {
+        "model": model,
+        "input": [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": text_input}
+        ]
+    }
+    if model == "gpt-5.2":
+        body["reasoning"] = {"effort": "medium"}
+    else:
+        body["temperature"] = 0.7  # Slight randomness helps with STS diversity
+    if structured_output:
+        body["text"] = text_format()
+    return body
+
+
+def extract_output_text(response_body):
+    """Concatenate the output text of a Responses API body (dict form, as in batch results)."""
+    if isinstance(response_body, dict) and response_body.get("output_text"):
+        return response_body["output_text"]
+    output_items = response_body.get("output", []) if isinstance(response_body, dict) else []
+    parts = []
+    for item in output_items:
+        if item.get("type") != "message":
+            continue
+        for content in item.get("content", []):
+            if content.get("type") in ("output_text", "text") and "text" in content:
+                parts.append(content["text"])
+    return "".join(parts)
+
+
+def extract_usage(usage):
+    """Return (input_tokens, output_tokens) from a usage dict of either API flavour."""
+    if not isinstance(usage, dict):
+        return 0, 0
+    input_tokens = usage.get("input_tokens", usage.get("prompt_tokens", 0))
+    output_tokens = usage.get("output_tokens", usage.get("completion_tokens", 0))
+    return input_tokens, output_tokens
+
+
+class Generator:
+    """In-process STS pair generator.
+
+    Yields records as they are produced, so training pipelines can consume pairs
+    while generation is still running::
+
+        generator = Generator("gpt-4o-mini", api_key=key, data_folder="/data", num_sentences=100)
+        async for record in generator.iter_pairs():
+            ...
+
+    Pass ``sentences`` to skip extraction from gzipped CSV files.
+    """
+
+    def __init__(self, model, api_key=None, client=None, data_folder=None, filename_filter=None,
+                 num_sentences=500, sentences=None, seed=None, prompt_type='both',
+                 prompts_file=PROMPTS_FILE, structured_output=False, concurrency=8, prefilter=None):
+        if sentences is None and data_folder is None:
+            raise ValueError("Generator needs either sentences or a data_folder")
+        self.model = model
+        self.client = client or AsyncOpenAI(api_key=api_key)
+        self.data_folder = data_folder
+        self.filename_filter = filename_filter
+        self.num_sentences = num_sentences
+        self.sentences = sentences
+        self.seed = seed
+        self.prompt_type = prompt_type
+        self.prompts = load_prompts(prompts_file)
+        self.structured_output = structured_output
+        self.concurrency = concurrency
+        self.prefilter = prefilter
+
+        self.parse_stats = ParseStats()
+        self.request_latencies = []
+        self.total_input_tokens = 0
+        self.total_output_tokens = 0
+        self.generation_time_s = 0.0
+
+    def load_sentences(self):
+        if self.sentences is not None:
+            return self.sentences
+        return extract_random_sentences_from_gzipped_csv(
+            self.data_folder,
+            num_sentences=self.num_sentences,
+            filename_filter=self.filename_filter,
+            seed=self.seed,
+            prefilter=self.prefilter
+        )
+
+    async def generate_pair(self, row, text_input):
+        """Generate one STS record; returns None when the request or parsing fails."""
+        prompt_instruction = row['Prompt']
+        prompt_type = row['Prompt type']
+
+        logger.info(f"PROMPT_TYPE={prompt_type} | INSTRUCTION={prompt_instruction[:80]}...")
+        logger.info(f"INPUT={text_input[:100]}...")
+
+        try:
+            request_kwargs = build_request_body(self.model, row, text_input, self.structured_output)
+            started = time.perf_counter()
+            response = await self.client.responses.create(**request_kwargs)
+            self.request_latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"ERROR={e}")
+            return None
+
+        # Extract token usage
+        input_tokens = getattr(response.usage, "input_tokens", 0) or getattr(response.usage, "prompt_tokens", 0)
+        output_tokens = getattr(response.usage, "output_tokens", 0) or getattr(response.usage, "completion_tokens", 0)
+        self.total_input_tokens += input_tokens
+        self.total_output_tokens += output_tokens
+
+        # Parse the response to ensure it's a valid STS record
+        try:
+            parsed_result = parse_sts_output(response.output_text)
+        except OutputParseError as e:
+            logger.error(f"PARSE_ERROR={e}")
+            self.parse_stats.add(False, output_tokens)
+            return None
+        self.parse_stats.add(True, output_tokens)
+
+        # Add prompt metadata to the result
+        parsed_result['prompt_type'] = prompt_type
+        parsed_result['prompt_instruction'] = prompt_instruction
+        parsed_result['input_sentence'] = text_input
+
+        logger.info(f"OUTPUT={parsed_result.get('output_sentence', '')[:100]}...")
+        return parsed_result
+
+    async def iter_pairs(self):
+        """Async generator yielding STS records in completion order.
+
+        At most ``concurrency`` requests are in flight. Closing the generator
+        early cancels the requests that have not finished yet.
+        """
+        sentences = await asyncio.to_thread(self.load_sentences)
+        logger.info(f"Starting STS generation | SENTENCES={len(sentences)} | MODEL={self.model}")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(idx, sentence):
+            row = select_prompt(self.prompts, idx, self.prompt_type)
+            async with semaphore:
+                return await self.generate_pair(row, sentence)
+
+        started = time.perf_counter()
+        tasks = [asyncio.ensure_future(run(idx, sentence)) for idx, sentence in enumerate(sentences, 1)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                record = await next_done
+                if record is not None:
+                    yield record
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.generation_time_s = time.perf_counter() - started
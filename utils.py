@@ -1,9 +1,13 @@
 import gzip
 import csv
+import json
+import heapq
 import random
+import hashlib
 from pathlib import Path
 import spacy
 from spacy.language import Language
+from prefilter import PREFILTER_CHUNK_ROWS, Prefilter
 
 _NLP = None
 
@@ -38,7 +42,62 @@ def get_first_sentence(text):
     return text
 
 
-def extract_random_sentences_from_gzipped_csv(data_folder, num_sentences, text_column="Body", filename_filter=None, seed=None):
+def _find_gz_files(data_folder, filename_filter=None):
+    """Gzipped files below data_folder whose name contains filename_filter."""
+    gz_files = list(Path(data_folder).glob("**/*.gz"))
+    if filename_filter:
+        gz_files = [f for f in gz_files if filename_filter in f.name]
+    return gz_files
+
+
+def _new_stats(prefilter):
+    """Counters for rows read and rows rejected per reason."""
+    stats = {"total_rows": 0, "missing_body": 0, "short_sentence": 0}
+    stats.update({f"prefilter_{name}": 0 for name in prefilter.rule_names})
+    return stats
+
+
+def _format_stats(stats):
+    return " ".join(f"{key}={value}" for key, value in stats.items() if key != "files")
+
+
+def _first_sentences(bodies, stats, prefilter):
+    # The prefilter runs on the whole chunk, so spaCy only sees plausible bodies
+    for body in prefilter.filter(bodies, stats):
+        sentence = get_first_sentence(body)
+        # Only include sentences with more than 3 words
+        if len(sentence.split()) > 3:
+            yield sentence
+        else:
+            stats["short_sentence"] += 1
+
+
+def _iter_first_sentences(gz_file, text_column, stats, prefilter, keep_row=None):
+    """Yield the first sentence of every valid row of a gzipped CSV file.
+
+    ``stats`` is a dict of counters (see ``_new_stats``) updated in place.
+    ``keep_row(row_number)`` can skip rows before any parsing.
+    """
+    chunk = []
+    with gzip.open(gz_file, 'rt', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        for row_number, row in enumerate(reader):
+            if keep_row is not None and not keep_row(row_number):
+                continue
+            stats["total_rows"] += 1
+            if text_column not in row or not row[text_column]:
+                stats["missing_body"] += 1
+                continue
+            chunk.append(row[text_column])
+            if len(chunk) >= PREFILTER_CHUNK_ROWS:
+                yield from _first_sentences(chunk, stats, prefilter)
+                chunk = []
+    if chunk:
+        yield from _first_sentences(chunk, stats, prefilter)
+
+
+def extract_random_sentences_from_gzipped_csv(data_folder, num_sentences, text_column="Body", filename_filter=None, seed=None,
+                                              prefilter=None):
     """Extract random first sentences from 'Body' column of a gzipped CSV file.
     
     Args:
@@ -47,15 +106,12 @@ def extract_random_sentences_from_gzipped_csv(data_folder, num_sentences, text_c
         text_column: The column name to extract text from
         filename_filter: Substring to filter filenames (only process files containing this string)
         seed: Random seed for reproducible sampling (default: None = non-deterministic)
+        prefilter: Prefilter applied before spaCy parsing (default: None = no prefiltering)
     
     Returns:
         List of random first sentences
     """
-    gz_files = list(Path(data_folder).glob("**/*.gz"))
-    
-    # Filter to files containing the substring
-    if filename_filter:
-        gz_files = [f for f in gz_files if filename_filter in f.name]
+    gz_files = _find_gz_files(data_folder, filename_filter)
     
     print(f"Found {len(gz_files)} matching gzipped files")
     
@@ -68,26 +124,12 @@ def extract_random_sentences_from_gzipped_csv(data_folder, num_sentences, text_c
     print(f"Processing file: {gz_file}")
     
     # First, collect all valid sentences
-    all_sentences = []
-    total_rows = 0
-    missing_body = 0
-    short_sentence = 0
-    with gzip.open(gz_file, 'rt', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            total_rows += 1
-            if text_column not in row or not row[text_column]:
-                missing_body += 1
-                continue
-            sentence = get_first_sentence(row[text_column])
-            # Only include sentences with more than 3 words
-            if len(sentence.split()) > 3:
-                all_sentences.append(sentence)
-            else:
-                short_sentence += 1
+    prefilter = prefilter or Prefilter(enabled=False)
+    stats = _new_stats(prefilter)
+    all_sentences = list(_iter_first_sentences(gz_file, text_column, stats, prefilter))
     
     print(f"Found {len(all_sentences)} sentences in file")
-    print(f"Non-valid sentences | total_rows={total_rows} missing_body={missing_body} short_sentence={short_sentence}")
+    print(f"Non-valid sentences | {_format_stats(stats)}")
     
     # Return random sample
     if len(all_sentences) <= num_sentences:
@@ -97,3 +139,97 @@ def extract_random_sentences_from_gzipped_csv(data_folder, num_sentences, text_c
         random.seed(seed)
     
     return random.sample(all_sentences, num_sentences)
+
+
+def stable_hash(*parts):
+    """64-bit hash of the given values that is identical across processes and machines."""
+    digest = hashlib.blake2b("\x1f".join(str(p) for p in parts).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def parse_shard(spec):
+    """Parse an ``i/N`` shard spec into (index, count) with 0 <= index < count."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec {spec!r}, expected i/N") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard spec {spec!r}, expected 0 <= i < N")
+    return index, count
+
+
+def extract_shard_sample(data_folder, num_sentences, shard_index=0, num_shards=1, text_column="Body",
+                         filename_filter=None, seed=42, partition="files", prefilter=None):
+    """Extract this shard's share of the archive and sample it locally.
+
+    Unlike ``extract_random_sentences_from_gzipped_csv`` all matching files are read.
+    With ``partition="files"`` a file belongs to the shard whose index equals the hash
+    of its path relative to ``data_folder`` modulo ``num_shards``; with ``"rows"`` every
+    node reads every file but only parses the rows hashed to it.
+
+    Sampling is bottom-k on ``stable_hash(seed, sentence)``: the shard keeps the
+    ``num_sentences`` unique sentences with the smallest keys. Merging the shards with
+    ``merge_shard_samples`` gives the same sample for any number of shards.
+
+    Returns (sample sorted by key as [(key, sentence), ...], stats dict).
+    """
+    gz_files = _find_gz_files(data_folder, filename_filter)
+    relative_names = {f: f.relative_to(data_folder).as_posix() for f in gz_files}
+    if partition == "files":
+        gz_files = [f for f in gz_files if stable_hash(relative_names[f]) % num_shards == shard_index]
+    elif partition != "rows":
+        raise ValueError(f"Unknown partition {partition!r}, expected 'files' or 'rows'")
+
+    print(f"Shard {shard_index}/{num_shards} | partition={partition} files={len(gz_files)}")
+
+    prefilter = prefilter or Prefilter(enabled=False)
+    stats = {"files": len(gz_files), **_new_stats(prefilter)}
+    # Max-heap (negated keys) holding the num_sentences smallest keys seen so far
+    heap = []
+    kept = set()
+    for gz_file in gz_files:
+        keep_row = None
+        if partition == "rows":
+            name = relative_names[gz_file]
+            keep_row = lambda row_number, name=name: stable_hash(name, row_number) % num_shards == shard_index
+        for sentence in _iter_first_sentences(gz_file, text_column, stats, prefilter, keep_row):
+            if sentence in kept:
+                continue
+            key = stable_hash(seed, sentence)
+            if len(heap) < num_sentences:
+                heapq.heappush(heap, (-key, sentence))
+                kept.add(sentence)
+            elif key < -heap[0][0]:
+                _, evicted = heapq.heappushpop(heap, (-key, sentence))
+                kept.discard(evicted)
+                kept.add(sentence)
+
+    print(f"Non-valid sentences | {_format_stats(stats)}")
+    return sorted((-neg_key, sentence) for neg_key, sentence in heap), stats
+
+
+def merge_shard_samples(shard_samples, num_sentences):
+    """Combine per-shard bottom-k samples (each sorted by key) into the global sample."""
+    merged = []
+    seen = set()
+    for _, sentence in heapq.merge(*shard_samples):
+        if sentence in seen:
+            continue
+        seen.add(sentence)
+        merged.append(sentence)
+        if len(merged) == num_sentences:
+            break
+    return merged
+
+
+def write_sentences_file(path, sentences):
+    """Write input sentences as JSONL (one {"input_sentence": ...} object per line)."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for sentence in sentences:
+            f.write(json.dumps({"input_sentence": sentence}) + '\n')
+
+
+def read_sentences_file(path):
+    """Read input sentences written by write_sentences_file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line)["input_sentence"] for line in f if line.strip()]